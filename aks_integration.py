@@ -1,54 +1,113 @@
 from azure.identity import DefaultAzureCredential
 from azure.mgmt.containerservice import ContainerServiceClient
-from config import Config
+from azure.core.pipeline.transport import RequestsTransport
+from config import CONFIG
 import logging
 from scaling_metrics import ScalingMetrics
 import os
+import requests
+import threading
+import time
+
+# Queries PromQL de auto_scale_node_pool (el namespace de KEDA es fijo tras cargar CONFIG)
+_Q_CPU = f'avg(rate(container_cpu_usage_seconds_total{{namespace="{CONFIG.KEDA_NAMESPACE}"}}[1m])) * 100'
+_Q_MEMORY = (
+    f'avg(container_memory_working_set_bytes{{namespace="{CONFIG.KEDA_NAMESPACE}"}}) / '
+    f'avg(container_spec_memory_limit_bytes{{namespace="{CONFIG.KEDA_NAMESPACE}"}}) * 100'
+)
+_Q_PODS = f'count(kube_pod_info{{namespace="{CONFIG.KEDA_NAMESPACE}"}})'
+_Q_RECORDED = f'keda:ns:metrics{{namespace="{CONFIG.KEDA_NAMESPACE}"}}'
+
+
+class _NoopK8sAPI:
+    """
+    Cliente Kubernetes sin conexión para modo local
+    Cualquier método devuelve una respuesta vacía; a diferencia de MagicMock
+    no crea ni registra objetos hijos en cada llamada
+    """
+    def __getattr__(self, _name):
+        return lambda *args, **kwargs: {'items': [], 'status': {'allowed': True}}
+
 
 class AKSManager:
+    # Credencial, sesión HTTP y cliente Azure compartidos entre instancias (se crean bajo demanda)
+    _shared_credential = None
+    _shared_session = None
+    _shared_client = None
+    _client_lock = threading.Lock()
+    
+    # Caché TTL de get_aks_cluster: (resource_group, resource_name) -> (expira_en, cluster)
+    _cluster_cache = {}
+    
+    # Supervisor compartido que ejecuta todos los schedulers de HPA en un solo hilo
+    _hpa_supervisor = None
+    
     def __init__(self):
-        self.config = Config()
-        self.credential = DefaultAzureCredential()
-        self.client = ContainerServiceClient(
-            credential=self.credential,
-            subscription_id=self.config.AZURE_SUBSCRIPTION_ID
-        )
+        self.config = CONFIG
+        self.client = self._get_shared_client(self.config.AZURE_SUBSCRIPTION_ID)
+        self.credential = AKSManager._shared_credential
         self.scaling_metrics = ScalingMetrics()
         
         # Configurar cliente Kubernetes
         self.k8s_client = self._configure_k8s_client()
         
+        # Última lectura evaluada en auto_scale_node_pool (para omitir ticks sin cambios)
+        self._last_metrics_fingerprint = None
+        self._last_tick = 0
+        
+    @classmethod
+    def _get_shared_client(cls, subscription_id: str) -> ContainerServiceClient:
+        """Devuelve el ContainerServiceClient compartido, creándolo la primera vez"""
+        with cls._client_lock:
+            if cls._shared_client is None:
+                cls._shared_credential = DefaultAzureCredential()
+                cls._shared_session = requests.Session()
+                cls._shared_client = ContainerServiceClient(
+                    credential=cls._shared_credential,
+                    subscription_id=subscription_id,
+                    transport=RequestsTransport(session=cls._shared_session, session_owner=False)
+                )
+            return cls._shared_client
+    
     def _configure_k8s_client(self):
         """
         Configura el cliente de Kubernetes con RBAC
-        En local, retorna un mock sin conexión real
+        En local, retorna clientes no-op sin conexión real
         """
         if os.getenv('ENVIRONMENT') == 'local':
             # Modo local - no requiere Kubernetes
-            from unittest.mock import MagicMock
             return {
-                'core': MagicMock(),
-                'apps': MagicMock(),
-                'custom': MagicMock()
+                'core': _NoopK8sAPI(),
+                'apps': _NoopK8sAPI(),
+                'custom': _NoopK8sAPI(),
+                'authorization': _NoopK8sAPI()
             }
             
         try:
             from kubernetes.config import load_incluster_config
-            from kubernetes.client import CoreV1Api, AppsV1Api, CustomObjectsApi
+            from kubernetes.client import (
+                ApiClient, Configuration, CoreV1Api, AppsV1Api, CustomObjectsApi, AuthorizationV1Api
+            )
             load_incluster_config()
             
+            # Un único ApiClient: todas las APIs comparten el pool de conexiones al apiserver
+            api_client = ApiClient(Configuration.get_default_copy())
             return {
-                'core': CoreV1Api(),
-                'apps': AppsV1Api(),
-                'custom': CustomObjectsApi()
+                'core': CoreV1Api(api_client),
+                'apps': AppsV1Api(api_client),
+                'custom': CustomObjectsApi(api_client),
+                'authorization': AuthorizationV1Api(api_client)
             }
             
         except Exception as e:
-            logging.error(f"Error configurando cliente Kubernetes: {str(e)}")
+            logging.error("Error configurando cliente Kubernetes: %s", e)
             raise
     
-    def check_rbac_permissions(self) -> bool:
-        """Verifica que tenemos los permisos RBAC necesarios"""
+    def check_rbac_permissions(self, namespace: str = "default") -> bool:
+        """
+        Verifica que tenemos los permisos RBAC necesarios
+        Usa un único SelfSubjectRulesReview y comprueba cada permiso localmente
+        """
         required_permissions = [
             ('pods', 'list'),
             ('deployments', 'patch'),
@@ -56,34 +115,54 @@ class AKSManager:
             ('scaledobjects.keda.sh', 'update')
         ]
         
+        if os.getenv('ENVIRONMENT') == 'local':
+            # Modo local - no hay cluster contra el que verificar
+            return True
+        
         try:
-            auth_api = self.k8s_client['custom'].list_cluster_custom_object(
-                group="authorization.k8s.io",
-                version="v1",
-                plural="selfsubjectaccessreviews",
-                body={"spec": {"resourceAttributes": {"namespace": "default"}}}
+            review = self.k8s_client['authorization'].create_self_subject_rules_review(
+                body={"spec": {"namespace": namespace}}
             )
             
+            if review.status.incomplete:
+                logging.warning("Revisión RBAC incompleta: %s", review.status.evaluation_error)
+            
+            allowed = {
+                (resource, verb)
+                for rule in review.status.resource_rules or []
+                for resource in rule.resources or []
+                for verb in rule.verbs or []
+            }
+            
+            missing = False
             for resource, verb in required_permissions:
-                if not auth_api['status']['allowed']:
-                    logging.error(f"Faltan permisos RBAC: {verb} en {resource}")
-                    return False
+                name = resource.split('.', 1)[0]  # 'scaledobjects.keda.sh' -> 'scaledobjects'
+                if not ({(name, verb), (name, '*'), ('*', verb), ('*', '*')} & allowed):
+                    logging.error("Faltan permisos RBAC: %s en %s", verb, resource)
+                    missing = True
             
-            return True
+            return not missing
             
         except Exception as e:
-            logging.error(f"Error verificando permisos RBAC: {str(e)}")
+            logging.error("Error verificando permisos RBAC: %s", e)
             return False
     
     def get_aks_cluster(self):
-        """Obtiene información del cluster AKS"""
+        """Obtiene información del cluster AKS (cacheada durante AKS_CLUSTER_CACHE_TTL segundos)"""
+        key = (f"MC_{self.config.AKS_CLUSTER_NAME}", self.config.AKS_CLUSTER_NAME)
+        cached = self._cluster_cache.get(key)
+        if cached and cached[0] > time.time():
+            return cached[1]
+        
         try:
-            return self.client.managed_clusters.get(
-                resource_group_name=f"MC_{self.config.AKS_CLUSTER_NAME}",
-                resource_name=self.config.AKS_CLUSTER_NAME
+            cluster = self.client.managed_clusters.get(
+                resource_group_name=key[0],
+                resource_name=key[1]
             )
+            self._cluster_cache[key] = (time.time() + self.config.AKS_CLUSTER_CACHE_TTL, cluster)
+            return cluster
         except Exception as e:
-            logging.error(f"Error al obtener cluster AKS: {e}")
+            logging.error("Error al obtener cluster AKS: %s", e)
             return None
     
     def scale_node_pool(self, pool_name: str, node_count: int):
@@ -99,7 +178,7 @@ class AKSManager:
             )
             return True
         except Exception as e:
-            logging.error(f"Error al escalar nodo pool {pool_name}: {e}")
+            logging.error("Error al escalar nodo pool %s: %s", pool_name, e)
             return False
 
     def auto_scale_node_pool(self, pool_name: str) -> bool:
@@ -107,55 +186,64 @@ class AKSManager:
         Escala automáticamente el nodo pool basado en métricas de Prometheus
         """
         try:
-            # Obtener métricas actuales
-            cpu_usage = self.scaling_metrics.get_prometheus_metrics(
-                f'avg(rate(container_cpu_usage_seconds_total{{namespace=\"{self.config.KEDA_NAMESPACE}\"}}[1m])) * 100'
-            )
-            memory_usage = self.scaling_metrics.get_prometheus_metrics(
-                f'avg(container_memory_working_set_bytes{{namespace=\"{self.config.KEDA_NAMESPACE}\"}}) / avg(container_spec_memory_limit_bytes{{namespace=\"{self.config.KEDA_NAMESPACE}\"}}) * 100'
-            )
+            if self.config.PROMETHEUS_RECORDING_RULES:
+                # Una sola query sobre la regla pre-agregada en el servidor
+                metrics = self.scaling_metrics.get_prometheus_vector(_Q_RECORDED, 'metric')
+                cpu_usage = metrics.get('cpu', 0.0)
+                memory_usage = metrics.get('mem', 0.0)
+                current_pods = metrics.get('pods', 0.0)
+            else:
+                # Obtener métricas actuales (CPU, memoria y número de pods) en una sola petición
+                metrics = self.scaling_metrics.get_prometheus_metrics_batch(
+                    {'cpu': _Q_CPU, 'mem': _Q_MEMORY, 'pods': _Q_PODS}
+                )
+                cpu_usage, memory_usage, current_pods = metrics['cpu'], metrics['mem'], metrics['pods']
+            current_pods = int(current_pods)
             
-            # Obtener número actual de pods
-            current_pods = int(self.scaling_metrics.get_prometheus_metrics(
-                f'count(kube_pod_info{{namespace=\"{self.config.KEDA_NAMESPACE}\"}})'
-            ))
+            # Omitir la decisión si las métricas no han cambiado dentro de la ventana de estabilización
+            fingerprint = (round(cpu_usage, 1), round(memory_usage, 1), current_pods)
+            now = time.time()
+            if fingerprint == self._last_metrics_fingerprint and \
+               now - self._last_tick < self.config.STABILIZATION_WINDOW:
+                return False
+            self._last_metrics_fingerprint = fingerprint
+            self._last_tick = now
             
             self.scaling_metrics.update_metrics(cpu_usage, memory_usage, current_pods)
             
             # Lógica de escalado
             if self.scaling_metrics.should_scale_up() and current_pods < self.config.MAX_REPLICAS:
                 new_count = min(current_pods + 1, self.config.MAX_REPLICAS)
-                logging.info(f"Escalando {pool_name} de {current_pods} a {new_count} pods")
+                logging.info("Escalando %s de %s a %s pods", pool_name, current_pods, new_count)
                 return self.scale_node_pool(pool_name, new_count)
             elif current_pods > self.config.MIN_REPLICAS and \
                  cpu_usage < self.config.CPU_SCALING_THRESHOLD * 0.7 and \
                  memory_usage < self.config.MEMORY_SCALING_THRESHOLD * 0.7:
                 new_count = max(current_pods - 1, self.config.MIN_REPLICAS)
-                logging.info(f"Reduciendo {pool_name} de {current_pods} a {new_count} pods")
+                logging.info("Reduciendo %s de %s a %s pods", pool_name, current_pods, new_count)
                 return self.scale_node_pool(pool_name, new_count)
             
             return False
         except Exception as e:
-            logging.error(f"Error en auto_scale_node_pool: {e}")
+            logging.error("Error en auto_scale_node_pool: %s", e)
             return False
 
-    def start_hpa_scheduler(self, namespace: str, hpa_name: str):
+    def start_hpa_scheduler(self, namespace: str, hpa_name: str, interval: int = 60):
         """
         Inicia el scheduler de ajustes horarios para HPA
         Ejemplo de uso:
         manager.start_hpa_scheduler(namespace='default', hpa_name='my-app-hpa')
+        `interval` es la espera (segundos) antes de reintentar tras un error.
         """
-        from hpa_scheduler import HPAScheduler
-        import threading
+        from hpa_scheduler import HPAScheduler, HPASupervisor
         
-        scheduler = HPAScheduler(self.k8s_client)
+        # Todos los HPAs comparten un único hilo supervisor en segundo plano
+        with self._client_lock:
+            if AKSManager._hpa_supervisor is None:
+                AKSManager._hpa_supervisor = HPASupervisor()
         
-        # Ejecutar en segundo plano
-        thread = threading.Thread(
-            target=scheduler.run_scheduled_adjustment,
-            args=(namespace, hpa_name),
-            daemon=True
-        )
-        thread.start()
+        scheduler = HPAScheduler(self.k8s_client)
+        AKSManager._hpa_supervisor.add(scheduler, namespace, hpa_name, interval)
         
-        logging.info(f"Iniciado scheduler de ajustes horarios para HPA {hpa_name}")
+        logging.info("Iniciado scheduler de ajustes horarios para HPA %s", hpa_name)
+        return scheduler
@@ -1,50 +1,86 @@
 import os
+from dataclasses import dataclass
+from datetime import time as dt_time
+from typing import ClassVar, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _env_bool(name: str, default: str) -> bool:
+    """Interpreta una variable de entorno booleana ('1', 'true', 'yes', 'on')"""
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+@dataclass(frozen=True)
 class Config:
-    KUBECONFIG = os.getenv('KUBECONFIG')
-    AKS_CLUSTER_NAME = os.getenv('AKS_CLUSTER_NAME')
-    AZURE_SUBSCRIPTION_ID = os.getenv('AZURE_SUBSCRIPTION_ID')
-    SPOT_NODE_POOL = os.getenv('SPOT_NODE_POOL', 'spot')
-    REGULAR_NODE_POOL = os.getenv('REGULAR_NODE_POOL', 'regular')
+    """
+    Configuración inmutable leída del entorno una sola vez al importar el módulo.
+    Usar la instancia compartida CONFIG en lugar de construir Config() en cada clase.
+    """
+    KUBECONFIG: Optional[str] = os.getenv('KUBECONFIG')
+    AKS_CLUSTER_NAME: Optional[str] = os.getenv('AKS_CLUSTER_NAME')
+    AZURE_SUBSCRIPTION_ID: Optional[str] = os.getenv('AZURE_SUBSCRIPTION_ID')
+    SPOT_NODE_POOL: str = os.getenv('SPOT_NODE_POOL', 'spot')
+    REGULAR_NODE_POOL: str = os.getenv('REGULAR_NODE_POOL', 'regular')
+    AKS_CLUSTER_CACHE_TTL: int = int(os.getenv('AKS_CLUSTER_CACHE_TTL', '300'))  # 5 minutos
     
     # Umbrales para rebalanceo
-    SPOT_UTILIZATION_THRESHOLD = float(os.getenv('SPOT_UTILIZATION_THRESHOLD', '0.7'))
-    REGULAR_UTILIZATION_THRESHOLD = float(os.getenv('REGULAR_UTILIZATION_THRESHOLD', '0.8'))
-    MAX_SPOT_INTERRUPTION_RISK = float(os.getenv('MAX_SPOT_INTERRUPTION_RISK', '0.3'))
+    SPOT_UTILIZATION_THRESHOLD: float = float(os.getenv('SPOT_UTILIZATION_THRESHOLD', '0.7'))
+    REGULAR_UTILIZATION_THRESHOLD: float = float(os.getenv('REGULAR_UTILIZATION_THRESHOLD', '0.8'))
+    MAX_SPOT_INTERRUPTION_RISK: float = float(os.getenv('MAX_SPOT_INTERRUPTION_RISK', '0.3'))
 
     # Configuraciones para KEDA/Prometheus
-    KEDA_NAMESPACE = os.getenv('KEDA_NAMESPACE', 'keda')
-    PROMETHEUS_URL = os.getenv('PROMETHEUS_URL', 'http://prometheus-kube-prometheus-prometheus.monitoring:9090')
-    SCALING_COOLDOWN = int(os.getenv('SCALING_COOLDOWN', '300'))  # 5 minutos
-    MIN_REPLICAS = int(os.getenv('MIN_REPLICAS', '1'))
-    MAX_REPLICAS = int(os.getenv('MAX_REPLICAS', '10'))
-    CPU_SCALING_THRESHOLD = int(os.getenv('CPU_SCALING_THRESHOLD', '70'))  # 70% de uso
-    MEMORY_SCALING_THRESHOLD = int(os.getenv('MEMORY_SCALING_THRESHOLD', '80'))  # 80% de uso
+    KEDA_NAMESPACE: str = os.getenv('KEDA_NAMESPACE', 'keda')
+    PROMETHEUS_URL: str = os.getenv('PROMETHEUS_URL', 'http://prometheus-kube-prometheus-prometheus.monitoring:9090')
+    SCALING_COOLDOWN: int = int(os.getenv('SCALING_COOLDOWN', '300'))  # 5 minutos
+    MIN_REPLICAS: int = int(os.getenv('MIN_REPLICAS', '1'))
+    MAX_REPLICAS: int = int(os.getenv('MAX_REPLICAS', '10'))
+    CPU_SCALING_THRESHOLD: int = int(os.getenv('CPU_SCALING_THRESHOLD', '70'))  # 70% de uso
+    MEMORY_SCALING_THRESHOLD: int = int(os.getenv('MEMORY_SCALING_THRESHOLD', '80'))  # 80% de uso
+    # Usar la regla de grabación keda:ns:metrics (k8s/prometheus-rules.yaml) en lugar de 3 queries
+    PROMETHEUS_RECORDING_RULES: bool = _env_bool('PROMETHEUS_RECORDING_RULES', 'false')
+    # Timeouts (conexión, lectura) de las consultas a Prometheus, en segundos
+    PROMETHEUS_CONNECT_TIMEOUT: float = float(os.getenv('PROMETHEUS_CONNECT_TIMEOUT', '3'))
+    PROMETHEUS_READ_TIMEOUT: float = float(os.getenv('PROMETHEUS_READ_TIMEOUT', '10'))
 
     # Configuración de entorno
-    ENVIRONMENT = os.getenv('ENVIRONMENT', 'local')  # local|production
+    ENVIRONMENT: str = os.getenv('ENVIRONMENT', 'local')  # local|production
+    TEST_MODE: bool = _env_bool('TEST_MODE', 'false')  # Evicciones sin cambios reales
 
     # Configuración de rendimiento
-    RESPONSE_TIME_THRESHOLD = float(os.getenv('RESPONSE_TIME_THRESHOLD', '1.0'))  # 1 segundo
-    MAX_RESPONSE_TIME = float(os.getenv('MAX_RESPONSE_TIME', '2.0'))  # 2 segundos
+    RESPONSE_TIME_THRESHOLD: float = float(os.getenv('RESPONSE_TIME_THRESHOLD', '1.0'))  # 1 segundo
+    MAX_RESPONSE_TIME: float = float(os.getenv('MAX_RESPONSE_TIME', '2.0'))  # 2 segundos
 
     # Configuración de estabilización
-    COOLDOWN_PERIOD = int(os.getenv('COOLDOWN_PERIOD', '300'))  # 5 minutos entre escalados
-    STABILIZATION_WINDOW = int(os.getenv('STABILIZATION_WINDOW', '60'))  # Segundos para considerar métricas estables
-    MIN_CHANGE_PERIOD = int(os.getenv('MIN_CHANGE_PERIOD', '120'))  # Mínimo tiempo entre cambios de pods
+    COOLDOWN_PERIOD: int = int(os.getenv('COOLDOWN_PERIOD', '300'))  # 5 minutos entre escalados
+    STABILIZATION_WINDOW: int = int(os.getenv('STABILIZATION_WINDOW', '60'))  # Segundos para considerar métricas estables
+    MIN_CHANGE_PERIOD: int = int(os.getenv('MIN_CHANGE_PERIOD', '120'))  # Mínimo tiempo entre cambios de pods
 
     # Configuración de ventanas horarias
-    TIME_WINDOWS = {
+    TIME_WINDOWS: ClassVar[Dict[str, dict]] = {
         'night': {'start': '00:00', 'end': '06:00', 'min_replicas': 1, 'max_replicas': 3},
         'morning': {'start': '06:00', 'end': '12:00', 'min_replicas': 2, 'max_replicas': 5},
         'afternoon': {'start': '12:00', 'end': '18:00', 'min_replicas': 3, 'max_replicas': 8},
         'evening': {'start': '18:00', 'end': '00:00', 'min_replicas': 2, 'max_replicas': 6}
     }
+    # Ventanas con horas ya parseadas: (nombre, inicio, fin, ventana)
+    TIME_WINDOWS_PARSED: ClassVar[List[Tuple[str, dt_time, dt_time, dict]]] = [
+        (name, dt_time.fromisoformat(w['start']), dt_time.fromisoformat(w['end']), w)
+        for name, w in TIME_WINDOWS.items()
+    ]
+    # Ventanas ordenadas por inicio y sus límites en minutos desde medianoche (para bisect)
+    TIME_WINDOW_SLOTS: ClassVar[List[Tuple[str, dt_time, dt_time, dict]]] = sorted(TIME_WINDOWS_PARSED, key=lambda w: w[1])
+    TIME_WINDOW_BOUNDARIES: ClassVar[List[int]] = [start.hour * 60 + start.minute for _, start, _, _ in TIME_WINDOW_SLOTS]
+    # Máximo de réplicas entre todas las ventanas (usado en el rollback)
+    GLOBAL_MAX_REPLICAS: ClassVar[int] = max(w['max_replicas'] for w in TIME_WINDOWS.values())
     
     # Configuración de rollback automático
-    ROLLBACK_ENABLED = bool(os.getenv('ROLLBACK_ENABLED', True))
-    ROLLBACK_THRESHOLD_CPU = int(os.getenv('ROLLBACK_THRESHOLD_CPU', 85))  # %
-    ROLLBACK_CHECK_INTERVAL = int(os.getenv('ROLLBACK_CHECK_INTERVAL', 300))  # segundos
+    ROLLBACK_ENABLED: bool = _env_bool('ROLLBACK_ENABLED', 'true')
+    ROLLBACK_THRESHOLD_CPU: int = int(os.getenv('ROLLBACK_THRESHOLD_CPU', 85))  # %
+    ROLLBACK_CHECK_INTERVAL: int = int(os.getenv('ROLLBACK_CHECK_INTERVAL', 300))  # segundos
+    ROLLBACK_LABEL_SELECTOR: str = os.getenv('ROLLBACK_LABEL_SELECTOR', '')  # ej. 'app=python-app'
+
+
+# Instancia compartida por todos los módulos
+CONFIG = Config()
@@ -1,39 +1,85 @@
 import os
 import time
+import bisect
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, time as dt_time
 import logging
+from functools import lru_cache
 from kubernetes.client import CustomObjectsApi
-from config import Config
+from config import CONFIG
+from utils import call_with_backoff
+
+
+@lru_cache(maxsize=1)
+def _window_at(hour: int, minute: int):
+    """
+    Ventana horaria para una hora dada (memoizada: se repite durante todo el minuto)
+    Las ventanas son contiguas y cubren 24h; antes del primer límite sigue vigente la última
+    """
+    if not CONFIG.TIME_WINDOW_SLOTS:
+        return None, None
+    
+    idx = bisect.bisect_right(CONFIG.TIME_WINDOW_BOUNDARIES, hour * 60 + minute) - 1
+    window_name, _, _, window = CONFIG.TIME_WINDOW_SLOTS[idx]
+    return window_name, window
+
+
+# Divisores para convertir cantidades de CPU de metrics.k8s.io a millicores
+_CPU_SUFFIX_DIVISOR = {'n': 1_000_000, 'u': 1_000, 'm': 1}
+
+
+def _cpu_millicores(quantity: str) -> float:
+    """Convierte una cantidad de CPU ('250m', '123456789n', '1') a millicores"""
+    divisor = _CPU_SUFFIX_DIVISOR.get(quantity[-1:])
+    if divisor is None:
+        return float(quantity) * 1000
+    return int(quantity[:-1]) / divisor
+
 
 class HPAScheduler:
     """
     Controlador para ajustar automáticamente los parámetros de HPA según horarios configurados
     """
     def __init__(self, k8s_client):
-        self.config = Config()
+        self.config = CONFIG
         self.k8s_client = k8s_client
         self.current_window = None
+        self._desired = None  # (minReplicas, maxReplicas) aplicados por última vez al HPA
         self.last_rollback_check = 0
+        self._stop_event = threading.Event()
         
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
         self.logger = logging.getLogger(__name__)
     
     def get_current_time_window(self) -> dict:
         """Determina la ventana horaria actual"""
-        now = datetime.now().time()
+        now = datetime.now()
+        return _window_at(now.hour, now.minute)
+    
+    def seconds_until_next_window(self) -> float:
+        """Calcula los segundos que faltan hasta el próximo cambio de ventana horaria"""
+        now = datetime.now()
+        now_seconds = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
         
-        for window_name, window in self.config.TIME_WINDOWS.items():
-            start = datetime.strptime(window['start'], '%H:%M').time()
-            end = datetime.strptime(window['end'], '%H:%M').time()
-            
-            if start <= now < end or \
-               (window['start'] > window['end'] and (now >= start or now < end)):
-                return window_name, window
+        boundaries = self.config.TIME_WINDOW_BOUNDARIES
+        idx = bisect.bisect_right(boundaries, now_seconds / 60)
+        next_start = boundaries[idx] if idx < len(boundaries) else boundaries[0] + 1440
         
-        return None, None
+        return next_start * 60 - now_seconds
+    
+    def _seconds_until_next_event(self) -> float:
+        """Tiempo de espera hasta el próximo cambio de ventana o chequeo de rollback"""
+        wait = self.seconds_until_next_window()
+        if self.config.ROLLBACK_ENABLED:
+            next_rollback_check = self.last_rollback_check + self.config.ROLLBACK_CHECK_INTERVAL
+            wait = min(wait, next_rollback_check - time.time())
+        return max(1.0, wait)
+    
+    def stop(self):
+        """Detiene el bucle de run_scheduled_adjustment"""
+        self._stop_event.set()
     
     def adjust_hpa(self, namespace: str, hpa_name: str):
         """Ajusta el HPA según la ventana horaria actual"""
@@ -45,37 +91,55 @@ class HPAScheduler:
             
         if window_name == self.current_window:
             return False  # No hay cambios necesarios
+        
+        desired = (window['min_replicas'], window['max_replicas'])
             
         try:
             if os.getenv('ENVIRONMENT') == 'local':
                 # Modo simulación - solo logging
                 self.logger.info(
-                    f"[SIMULACIÓN] Ajuste HPA {hpa_name} para {window_name}: "
-                    f"min={window['min_replicas']}, max={window['max_replicas']}"
+                    "[SIMULACIÓN] Ajuste HPA %s para %s: min=%s, max=%s",
+                    hpa_name, window_name, window['min_replicas'], window['max_replicas']
                 )
             else:
-                # Modo producción - ajuste real
-                body = {
-                    "spec": {
-                        "minReplicas": window['min_replicas'],
-                        "maxReplicas": window['max_replicas']
-                    }
-                }
+                if self._desired is None:
+                    # Primer ajuste (p.ej. tras reiniciar): leer la spec actual para no parchear en vano
+                    hpa = call_with_backoff(
+                        self.k8s_client['custom'].get_namespaced_custom_object,
+                        group="autoscaling",
+                        version="v2",
+                        namespace=namespace,
+                        plural="horizontalpodautoscalers",
+                        name=hpa_name
+                    )
+                    spec = hpa.get('spec', {})
+                    self._desired = (spec.get('minReplicas'), spec.get('maxReplicas'))
                 
-                self.k8s_client['custom'].patch_namespaced_custom_object(
-                    group="autoscaling",
-                    version="v2",
-                    namespace=namespace,
-                    plural="horizontalpodautoscalers",
-                    name=hpa_name,
-                    body=body
-                )
+                if desired != self._desired:
+                    # Modo producción - ajuste real
+                    body = {
+                        "spec": {
+                            "minReplicas": window['min_replicas'],
+                            "maxReplicas": window['max_replicas']
+                        }
+                    }
+                    
+                    call_with_backoff(
+                        self.k8s_client['custom'].patch_namespaced_custom_object,
+                        group="autoscaling",
+                        version="v2",
+                        namespace=namespace,
+                        plural="horizontalpodautoscalers",
+                        name=hpa_name,
+                        body=body
+                    )
             
+            self._desired = desired
             self.current_window = window_name
             return True
             
         except Exception as e:
-            self.logger.error(f"Error ajustando HPA: {str(e)}")
+            self.logger.error("Error ajustando HPA: %s", e)
             return False
     
     def check_rollback_conditions(self, namespace: str, hpa_name: str) -> bool:
@@ -90,37 +154,35 @@ class HPAScheduler:
         self.last_rollback_check = now
         
         try:
-            # Obtener métricas de CPU
+            # Obtener métricas de CPU (filtradas en el servidor si hay selector)
             cpu_usage = self.k8s_client['custom'].list_namespaced_custom_object(
                 group="metrics.k8s.io",
                 version="v1beta1",
                 namespace=namespace,
-                plural="pods"
+                plural="pods",
+                label_selector=self.config.ROLLBACK_LABEL_SELECTOR
             )
             
-            total_cpu = 0
-            count = 0
-            
-            for pod in cpu_usage.get('items', []):
-                for container in pod.get('containers', []):
-                    cpu = container.get('usage', {}).get('cpu', '0m')
-                    total_cpu += int(cpu.rstrip('m'))
-                    count += 1
-            
-            avg_cpu = total_cpu / max(1, count)
+            values = [
+                _cpu_millicores(container.get('usage', {}).get('cpu', '0m'))
+                for pod in cpu_usage.get('items', [])
+                for container in pod.get('containers', [])
+            ]
+            avg_cpu = sum(values) / max(1, len(values))
             
             if avg_cpu > self.config.ROLLBACK_THRESHOLD_CPU:
                 self.logger.warning(
-                    f"CPU promedio {avg_cpu:.1f}m supera umbral de rollback. "
-                    f"Restaurando configuración máxima"
+                    "CPU promedio %.1fm supera umbral de rollback. "
+                    "Restaurando configuración máxima", avg_cpu
                 )
                 
                 # Restaurar límites máximos
                 body = {
-                    "spec": {"maxReplicas": max(w['max_replicas'] for w in self.config.TIME_WINDOWS.values())}
+                    "spec": {"maxReplicas": self.config.GLOBAL_MAX_REPLICAS}
                 }
                 
-                self.k8s_client['custom'].patch_namespaced_custom_object(
+                call_with_backoff(
+                    self.k8s_client['custom'].patch_namespaced_custom_object,
                     group="autoscaling",
                     version="v2",
                     namespace=namespace,
@@ -128,34 +190,99 @@ class HPAScheduler:
                     name=hpa_name,
                     body=body
                 )
+                if self._desired:
+                    self._desired = (self._desired[0], self.config.GLOBAL_MAX_REPLICAS)
                 return True
                 
         except Exception as e:
-            self.logger.error(f"Error verificando rollback: {str(e)}")
+            self.logger.error("Error verificando rollback: %s", e)
             
         return False
     
+    def run_once(self, namespace: str, hpa_name: str, interval: int = 60) -> float:
+        """Ejecuta un ciclo de ajuste y devuelve los segundos hasta el siguiente"""
+        try:
+            self.adjust_hpa(namespace, hpa_name)
+            self.check_rollback_conditions(namespace, hpa_name)
+            wait = self._seconds_until_next_event()
+            if self.current_window != self.get_current_time_window()[0]:
+                # Los límites de la ventana no se aplicaron (adjust_hpa falló): reintentar tras `interval`
+                return min(interval, wait)
+            return wait
+        except Exception as e:
+            self.logger.error("Error en scheduler: %s", e)
+            return interval
+    
     def run_scheduled_adjustment(self, namespace: str, hpa_name: str, interval: int = 60):
-        """Ejecuta ajustes continuos cada intervalo especificado"""
+        """
+        Ejecuta ajustes guiados por eventos: el scheduler solo despierta al cruzar
+        el límite de una ventana horaria o cuando toca revisar el rollback.
+        `interval` se usa como espera tras un error.
+        """
         self.logger.info("Iniciando scheduler de ajustes horarios para HPA")
         
-        while True:
+        while not self._stop_event.is_set():
             try:
-                self.adjust_hpa(namespace, hpa_name)
-                self.check_rollback_conditions(namespace, hpa_name)
-                time.sleep(interval)
-                
+                self._stop_event.wait(self.run_once(namespace, hpa_name, interval))
             except KeyboardInterrupt:
                 self.logger.info("Deteniendo scheduler de ajustes horarios")
                 break
-            except Exception as e:
-                self.logger.error(f"Error en scheduler: {str(e)}")
-                time.sleep(interval)
+
+
+class HPASupervisor:
+    """
+    Planifica varios HPAScheduler desde un único hilo
+    Mantiene una cola de prioridad con la próxima ejecución de cada HPA, de modo que
+    N HPAs no requieren N hilos bloqueados. Cada run_once (llamadas a la API con
+    reintentos) se ejecuta en un pool pequeño: un HPA lento no retrasa a los demás.
+    """
+    def __init__(self, max_workers: int = 4):
+        self._queue = []  # heap de (próxima_ejecución, secuencia, scheduler, namespace, hpa_name, interval)
+        self._counter = itertools.count()
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+    
+    def add(self, scheduler: HPAScheduler, namespace: str, hpa_name: str, interval: int = 60):
+        """Registra un HPA; su primer ajuste se ejecuta inmediatamente"""
+        with self._wakeup:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._schedule(time.time(), scheduler, namespace, hpa_name, interval)
+    
+    def _schedule(self, when: float, scheduler: HPAScheduler, namespace: str, hpa_name: str, interval: int):
+        with self._wakeup:
+            heapq.heappush(self._queue, (when, next(self._counter), scheduler, namespace, hpa_name, interval))
+            self._wakeup.notify()
+    
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._queue or self._queue[0][0] > time.time():
+                    timeout = self._queue[0][0] - time.time() if self._queue else None
+                    self._wakeup.wait(timeout)
+                _, _, scheduler, namespace, hpa_name, interval = heapq.heappop(self._queue)
+            
+            if scheduler._stop_event.is_set():
+                continue
+            
+            self._executor.submit(self._run_scheduler, scheduler, namespace, hpa_name, interval)
+    
+    def _run_scheduler(self, scheduler: HPAScheduler, namespace: str, hpa_name: str, interval: int):
+        """Ejecuta un ciclo del HPA en el pool y lo vuelve a encolar (nunca hay dos ciclos del mismo HPA a la vez)"""
+        wait = scheduler.run_once(namespace, hpa_name, interval)
+        self._schedule(time.time() + wait, scheduler, namespace, hpa_name, interval)
 
 
 if __name__ == "__main__":
     from aks_integration import AKSManager
     
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    
     manager = AKSManager()
     scheduler = HPAScheduler(manager.k8s_client)
     
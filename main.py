@@ -14,46 +14,152 @@ Características principales:
 - Simulación de interrupción de nodos Spot y comportamiento de fallback
 """
 
+import os
 import time
 import logging
 import random
-from typing import Dict, List, Optional, Tuple
+import threading
+import heapq
+from collections import defaultdict
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+from config import _env_bool  # Misma interpretación de booleanos que el resto de la configuración
+
+log = logging.getLogger(__name__)
 
 # Importaciones de Kubernetes: Necesarias para el modo de producción
 # Se cargan condicionalmente dentro de la clase para el modo de simulación.
 try:
     import kubernetes.client
-    from kubernetes import config, client
+    import requests
+    from kubernetes import config, client, watch
     from kubernetes.client.rest import ApiException
     KUBERNETES_AVAILABLE = True
 except ImportError:
     KUBERNETES_AVAILABLE = False
-    logging.warning("Módulos de Kubernetes no encontrados. El rebalanceador solo funcionará en modo simulación.")
+    log.warning("Módulos de Kubernetes no encontrados. El rebalanceador solo funcionará en modo simulación.")
 
 
 # Definiciones básicas para la simulación
 class Config:
     def __init__(self):
         self.REBALANCE_INTERVAL_SECONDS = 30 # Intervalo de ejecución del rebalanceo
+        # Separación mínima entre ciclos disparados por eventos (p.ej. pods recreados tras nuestras evicciones)
+        self.REBALANCE_MIN_INTERVAL_SECONDS = 5
+        # Inventario de pods desde el kubelet de cada nodo (/pods) en lugar del apiserver
+        self.USE_KUBELET_API = _env_bool('USE_KUBELET_API', 'false')
+        self.KUBELET_PORT = int(os.getenv('KUBELET_PORT', '10250'))
+        # En modo DaemonSet (NODE_NAME vía downward API) solo se consulta el kubelet del propio nodo
+        self.NODE_NAME = os.getenv('NODE_NAME', '')
 
-# Funciones dummy para la simulación
-def calculate_node_score(node_info: Dict) -> float:
-    """Simula el cálculo de un score para un nodo.
-    En la simulación, un score simple basado en capacidad relativa.
+# Credenciales del ServiceAccount montadas en el pod
+_SERVICE_ACCOUNT_DIR = '/var/run/secrets/kubernetes.io/serviceaccount'
+
+# Sufijos de cantidades de Kubernetes
+_CPU_SUFFIXES = {'n': 1e-9, 'u': 1e-6, 'm': 1e-3}
+# Memoria: sufijos binarios, decimales ('k' en minúscula) y mili; '1e9' se resuelve con float()
+_MEMORY_SUFFIXES_GB = {
+    'Ki': 1 / 1024 ** 2, 'Mi': 1 / 1024, 'Gi': 1.0, 'Ti': 1024.0, 'Pi': 1024.0 ** 2, 'Ei': 1024.0 ** 3,
+    'm': 1e-3 / 1024 ** 3, 'k': 1e3 / 1024 ** 3, 'M': 1e6 / 1024 ** 3, 'G': 1e9 / 1024 ** 3,
+    'T': 1e12 / 1024 ** 3, 'P': 1e15 / 1024 ** 3, 'E': 1e18 / 1024 ** 3,
+}
+
+
+# Las cantidades se repiten mucho entre pods y nodos: los parseos se memorizan
+@lru_cache(maxsize=1024)
+def _parse_cpu(quantity: str) -> float:
+    """Convierte una cantidad de CPU de Kubernetes ('250m', '2') a cores."""
+    factor = _CPU_SUFFIXES.get(quantity[-1:])
+    if factor is None:
+        return float(quantity)
+    return float(quantity[:-1]) * factor
+
+
+@lru_cache(maxsize=1024)
+def _parse_memory_gb(quantity: str) -> float:
+    """Convierte una cantidad de memoria de Kubernetes ('512Mi', '16Gi', '512k', '1e9') a GiB."""
+    for suffix in (quantity[-2:], quantity[-1:]):
+        factor = _MEMORY_SUFFIXES_GB.get(suffix)
+        if factor is not None:
+            return float(quantity[:-len(suffix)]) * factor
+    return float(quantity) / 1024 ** 3
+
+
+@lru_cache(maxsize=1024)
+def _parse_alloc(cpu: str, memory: str) -> Tuple[float, float]:
+    """Convierte el allocatable de un nodo a (cores, GiB)."""
+    return _parse_cpu(cpu), _parse_memory_gb(memory)
+
+
+def _normalize_pod(pod: Dict) -> Dict:
     """
-    cpu_capacity = float(node_info['allocatable']['cpu'])
-    mem_capacity_gb = float(node_info['allocatable']['memory'].replace('Gi', ''))
-    return (cpu_capacity * 0.7) + (mem_capacity_gb * 0.3)
+    Guarda en el pod sus requests ya convertidas ('_cpu_req' en cores, '_mem_req_gb' en GiB)
+    y la etiqueta 'critical' como booleano ('_critical').
+    """
+    if '_cpu_req' not in pod:
+        reqs = pod['resources']['requests']
+        pod['_cpu_req'] = _parse_cpu(reqs['cpu'])
+        pod['_mem_req_gb'] = _parse_memory_gb(reqs['memory'])
+        pod['_critical'] = pod.get('labels', {}).get('critical') == 'true'
+    return pod
+
+
+def _normalize_node(node: Dict) -> Dict:
+    """Guarda en el nodo su allocatable ya convertido ('_cpu_alloc' en cores, '_mem_alloc_gb' en GiB)."""
+    node['_cpu_alloc'], node['_mem_alloc_gb'] = _parse_alloc(
+        node['allocatable']['cpu'], node['allocatable']['memory']
+    )
+    return node
+
+
+def _is_spot_node(labels: Dict) -> bool:
+    """Detecta nodos Spot de AKS por sus etiquetas."""
+    return labels.get('kubernetes.azure.com/scalesetpriority', '').lower() == 'spot' or \
+           labels.get('spot') == 'true'
 
 
+def _pod_to_dict(pod) -> Dict:
+    """Convierte un V1Pod al formato de diccionario usado por el rebalanceador."""
+    cpu_req = 0.0
+    mem_req_gb = 0.0
+    for container in pod.spec.containers or []:
+        reqs = (container.resources.requests if container.resources else None) or {}
+        cpu_req += _parse_cpu(reqs.get('cpu', '0'))
+        mem_req_gb += _parse_memory_gb(reqs.get('memory', '0'))
+
+    created = pod.metadata.creation_timestamp
+    labels = pod.metadata.labels or {}
+    return {
+        'name': pod.metadata.name,
+        'namespace': pod.metadata.namespace,
+        'resources': {'requests': {'cpu': f"{cpu_req}", 'memory': f"{mem_req_gb}Gi"}},
+        'labels': labels,
+        'creation_timestamp': created.timestamp() if created else time.time(),
+        '_cpu_req': cpu_req,
+        '_mem_req_gb': mem_req_gb,
+        '_critical': labels.get('critical') == 'true'
+    }
+
+
+def _spot_target_score(cpu_alloc: float, mem_alloc_gb: float, cpu_used: float, mem_used_gb: float) -> float:
+    """Score de un nodo destino: capacidad base (70% CPU, 30% memoria) ponderada por su fracción libre."""
+    cpu_utilization = cpu_used / cpu_alloc if cpu_alloc > 0 else 1.0
+    mem_utilization = mem_used_gb / mem_alloc_gb if mem_alloc_gb > 0 else 1.0
+    utilization_factor = ((1 - cpu_utilization) + (1 - mem_utilization)) / 2.0
+    return (cpu_alloc * 0.7 + mem_alloc_gb * 0.3) * (1 + utilization_factor * 2)
+
+
+# Funciones dummy para la simulación
 def safe_evict_pod(pod_name: str, pod_namespace: str, pod_labels: Dict) -> bool:
     """Simula la expulsión segura de un pod, respetando PDBs.
     En la simulación, siempre permitimos la expulsión si no es crítico.
     """
     if pod_labels.get('critical') == 'true':
-        logging.info(f"[SIMULACIÓN PDB] No se puede expulsar pod {pod_name}: es crítico. PDB impide interrupción.")
+        log.info("[SIMULACIÓN PDB] No se puede expulsar pod %s: es crítico. PDB impide interrupción.", pod_name)
         return False
-    logging.info(f"[SIMULACIÓN PDB] Pod {pod_name} expulsado lógicamente y se reprogramará.")
+    log.info("[SIMULACIÓN PDB] Pod %s expulsado lógicamente y se reprogramará.", pod_name)
     return True
 
 
@@ -69,12 +175,52 @@ class ClusterRebalancer:
         self.last_rebalance_time = 0
         self.max_pods_per_cycle = 10 
         
+        # Evicciones en producción: oleadas de hasta `eviction_parallelism` pods en paralelo,
+        # separadas `eviction_window_ms`; los 429 (PDB o rate limit) se reintentan con jitter
+        self.eviction_parallelism = 8
+        self.eviction_window_ms = 100
+        self.eviction_max_retries = 3
+        # Pools de producción, creados en el primer uso (la simulación no los necesita); ver close()
+        self._eviction_pool: Optional[ThreadPoolExecutor] = None
+        self._api_pool: Optional[ThreadPoolExecutor] = None
+        
         self.simulation_mode = simulation_mode
         
+        # Índice inverso nombre de pod -> nodo simulado que lo aloja
+        self._pod_to_node: Dict[str, str] = {}
+        # Nombres de los pods simulados no críticos (candidatos a migrar)
+        self._noncritical_pods: Set[str] = set()
+        
         # Clientes de la API de Kubernetes (solo si no es modo simulación y módulos están disponibles)
         self.api = None
         self.apps_api = None
         self.policy_api = None
+        self.custom_api = None
+
+        # Caché local de nodos y pods mantenida por informers (watch), solo en producción
+        self._cache_lock = threading.Lock()
+        self._node_cache: Dict[str, object] = {}
+        self._pod_cache_by_node: Dict[str, Dict[Tuple[str, str], object]] = {}
+        self._pod_node_index: Dict[Tuple[str, str], str] = {}
+        self._informers_running = False
+        self._informers_synced = {'nodes': threading.Event(), 'pods': threading.Event()}
+        self._stop_informers = threading.Event()
+        
+        # Sesión HTTP hacia los kubelets (solo con USE_KUBELET_API en producción)
+        self._use_kubelet_api = False
+        self._kubelet_session = None
+        
+        # Se activa cuando un cambio del cluster justifica rebalancear antes del próximo intervalo
+        self._dirty = threading.Event()
+        
+        # Heap de nodos Spot simulados por score (-score, nombre) con borrado perezoso:
+        # las entradas cuyo score no coincide con _spot_scores están obsoletas y se descartan
+        self._spot_heap: List[Tuple[float, str]] = []
+        self._spot_scores: Dict[str, float] = {}
+        
+        # Caché TTL de get_node_metrics: (expira_en, métricas); se invalida tras mover pods
+        self.metrics_cache_ttl = 5
+        self._metrics_cache: Optional[Tuple[float, Dict[str, Dict]]] = None
 
         if not self.simulation_mode and KUBERNETES_AVAILABLE:
             try:
@@ -83,42 +229,51 @@ class ClusterRebalancer:
                 self.api = client.CoreV1Api()
                 self.apps_api = client.AppsV1Api()
                 self.policy_api = client.PolicyV1Api()
-                logging.info("Conexión a Kubernetes API establecida.")
+                self.custom_api = client.CustomObjectsApi()
+                log.info("Conexión a Kubernetes API establecida.")
+                if self.config.USE_KUBELET_API:
+                    self._configure_kubelet_session()
+                self._start_informers()
             except config.ConfigException as e:
-                logging.error(f"Error al cargar la configuración de Kubernetes: {e}. Asegúrate de que KUBECONFIG está configurado o el script corre in-cluster.")
+                log.error("Error al cargar la configuración de Kubernetes: %s. Asegúrate de que KUBECONFIG está configurado o el script corre in-cluster.", e)
                 self.simulation_mode = True # Forzar modo simulación si falla la conexión
-                logging.info("Forzando modo simulación debido a fallo en conexión a Kubernetes.")
+                log.info("Forzando modo simulación debido a fallo en conexión a Kubernetes.")
         elif not KUBERNETES_AVAILABLE:
-            logging.warning("Módulos de Kubernetes no disponibles. El rebalanceador solo funcionará en modo simulación.")
+            log.warning("Módulos de Kubernetes no disponibles. El rebalanceador solo funcionará en modo simulación.")
             self.simulation_mode = True
 
         # --- Configuración de Simulación (siempre presente para inicializar el estado) ---
+        # 'pods' de cada nodo es un diccionario nombre -> pod (altas y bajas O(1))
         self.simulated_nodes: Dict[str, Dict] = {
             'aks-spot-1': {
                 'is_spot': True, 
                 'allocatable': {'cpu': '4', 'memory': '16Gi'},
                 'current_cpu_usage': 0.0,
                 'current_mem_usage_gb': 0.0,
-                'pods': []
+                'pods': {}
             },
             'aks-spot-2': {
                 'is_spot': True, 
                 'allocatable': {'cpu': '2', 'memory': '8Gi'},
                 'current_cpu_usage': 0.0,
                 'current_mem_usage_gb': 0.0,
-                'pods': []
+                'pods': {}
             },
             'aks-regular-1': {
                 'is_spot': False, 
                 'allocatable': {'cpu': '8', 'memory': '32Gi'},
                 'current_cpu_usage': 0.0,
                 'current_mem_usage_gb': 0.0,
-                'pods': [] 
+                'pods': {}
             }
         }
+        for node in self.simulated_nodes.values():
+            _normalize_node(node)
         
         self._initialize_regular_node_pods() # Inicializa pods para la simulación
-        self._update_simulated_node_usage('aks-regular-1')
+        for node_name in self.simulated_nodes:
+            self._recompute_node_usage(node_name)
+            self._push_spot_score(node_name)
 
     def _initialize_regular_node_pods(self):
         """Inicializa un conjunto de pods de prueba en el nodo regular."""
@@ -128,7 +283,7 @@ class ClusterRebalancer:
             pod_mem = f"{0.5 + (i % 3) * 0.5}Gi"
             is_critical = 'false' if i % 3 != 0 else 'true'
             
-            initial_pods.append({
+            initial_pods.append(_normalize_pod({
                 'name': f'app-{i}', 
                 'namespace': 'default', 
                 'resources': {
@@ -140,12 +295,32 @@ class ClusterRebalancer:
                 'labels': {'critical': is_critical, 
                            'app.kubernetes.io/name': f'app-{i}'},
                 'creation_timestamp': time.time() - i * 3600 
-            })
-        self.simulated_nodes['aks-regular-1']['pods'] = initial_pods
+            }))
+        self.simulated_nodes['aks-regular-1']['pods'] = {pod['name']: pod for pod in initial_pods}
+        for pod in initial_pods:
+            self._track_pod(pod, 'aks-regular-1')
+
+    def _track_pod(self, pod: Dict, node_name: str):
+        """Registra en qué nodo está un pod simulado y si es candidato a migrar (no crítico)."""
+        self._pod_to_node[pod['name']] = node_name
+        if not pod['_critical']:
+            self._noncritical_pods.add(pod['name'])
+
+    def _untrack_pod(self, pod: Dict):
+        """Olvida un pod simulado que ya no está en ningún nodo."""
+        self._pod_to_node.pop(pod['name'], None)
+        self._noncritical_pods.discard(pod['name'])
+
+    def _noncritical_pods_on(self, node_name: str) -> List[Dict]:
+        """Pods no críticos alojados en un nodo simulado."""
+        return [
+            pod for pod in self.simulated_nodes.get(node_name, {}).get('pods', {}).values()
+            if pod['name'] in self._noncritical_pods
+        ]
 
 
-    def _update_simulated_node_usage(self, node_name: str):
-        """Actualiza el uso simulado de CPU y memoria de un nodo."""
+    def _recompute_node_usage(self, node_name: str):
+        """Recalcula desde cero el uso simulado de CPU y memoria de un nodo (solo al inicializar)."""
         node = self.simulated_nodes.get(node_name)
         if not node:
             return
@@ -153,58 +328,327 @@ class ClusterRebalancer:
         node['current_cpu_usage'] = 0.0
         node['current_mem_usage_gb'] = 0.0
 
-        for pod in node.get('pods', []):
-            cpu_req = float(pod['resources']['requests']['cpu'].replace('m', ''))
-            if 'm' in pod['resources']['requests']['cpu']: 
-                cpu_req /= 1000.0 
-            mem_req = float(pod['resources']['requests']['memory'].replace('Gi', ''))
+        for pod in node.get('pods', {}).values():
+            node['current_cpu_usage'] += pod['_cpu_req']
+            node['current_mem_usage_gb'] += pod['_mem_req_gb']
 
-            node['current_cpu_usage'] += cpu_req
-            node['current_mem_usage_gb'] += mem_req
+    def _apply_delta(self, node_name: str, d_cpu: float, d_mem_gb: float):
+        """Ajusta incrementalmente el uso simulado de un nodo al añadir (+) o quitar (-) un pod."""
+        node = self.simulated_nodes[node_name]
+        node['current_cpu_usage'] += d_cpu
+        node['current_mem_usage_gb'] += d_mem_gb
+        self._push_spot_score(node_name)
 
+    def _push_spot_score(self, node_name: str):
+        """Registra en el heap el score actual de un nodo Spot simulado."""
+        node = self.simulated_nodes[node_name]
+        if not node['is_spot']:
+            return
+        score = _spot_target_score(
+            node['_cpu_alloc'], node['_mem_alloc_gb'],
+            node['current_cpu_usage'], node['current_mem_usage_gb']
+        )
+        self._spot_scores[node_name] = score
+        heapq.heappush(self._spot_heap, (-score, node_name))
 
     def get_node_metrics(self) -> Dict[str, Dict]:
         """
         Obtiene métricas de los nodos. En modo simulación, usa datos internos.
         En modo real, interactúa con la API de Kubernetes.
+        El resultado se reutiliza durante metrics_cache_ttl segundos salvo que se invalide.
         """
-        if self.simulation_mode:
-            for node_name in list(self.simulated_nodes.keys()):
-                self._update_simulated_node_usage(node_name)
+        cached = self._metrics_cache
+        if cached and cached[0] > time.time():
+            return cached[1]
+        
+        metrics = self._collect_node_metrics()
+        self._metrics_cache = (time.time() + self.metrics_cache_ttl, metrics)
+        return metrics
 
+    def _invalidate_metrics_cache(self):
+        """Descarta las métricas cacheadas tras un cambio en la ubicación de los pods."""
+        self._metrics_cache = None
+
+    def _collect_node_metrics(self) -> Dict[str, Dict]:
+        """Obtiene las métricas de los nodos sin pasar por la caché."""
+        if self.simulation_mode:
+            # El uso de cada nodo se mantiene al día con _apply_delta en cada movimiento
             metrics = {}
             for name, info in self.simulated_nodes.items():
                 metrics[name] = {
                     'is_spot': info['is_spot'],
-                    'pods': len(info.get('pods', [])),
+                    'pods': len(info.get('pods', {})),
                     'allocatable': info['allocatable'],
+                    '_cpu_alloc': info['_cpu_alloc'],
+                    '_mem_alloc_gb': info['_mem_alloc_gb'],
                     'current_cpu_usage': info['current_cpu_usage'],
                     'current_mem_usage_gb': info['current_mem_usage_gb']
                 }
             return metrics
         else:
             # --- LÓGICA DE PRODUCCIÓN REAL: Obtener métricas de nodos de Kubernetes ---
-            # Implementar esto para obtener la lista de nodos, sus etiquetas, capacidad y pods
-            # Ejemplo:
-            # nodes = self.api.list_node().items
-            # metrics = {}
-            # for node in nodes:
-            #     is_spot = 'Spot' in node.metadata.labels.get('kubernetes.azure.com/scalesetpriority', '') or \
-            #               node.metadata.labels.get('spot') == 'true'
-            #     allocatable_cpu = node.status.allocatable.get('cpu', '0')
-            #     allocatable_mem = node.status.allocatable.get('memory', '0Gi')
-            #     # Calcular current_cpu_usage y current_mem_usage_gb requiere listar pods y sumar sus requests
-            #     # pods_on_node = self.api.list_namespaced_pod(field_selector=f"spec.nodeName={node.metadata.name}").items
-            #     metrics[node.metadata.name] = {
-            #         'is_spot': is_spot,
-            #         'pods': len(pods_on_node), # Placeholder
-            #         'allocatable': {'cpu': allocatable_cpu, 'memory': allocatable_mem},
-            #         'current_cpu_usage': 0.0, # Placeholder
-            #         'current_mem_usage_gb': 0.0 # Placeholder
-            #     }
-            # return metrics
-            logging.error("Función get_node_metrics en modo producción no implementada.")
-            return {} # Retorno vacío si no está implementado en producción
+            # metrics-server se consulta mientras se obtiene el inventario de nodos y pods
+            usage_future = self._api_executor.submit(self._get_node_usage)
+            nodes, pods_by_node = self._snapshot_cluster()
+            usage_by_node = usage_future.result()
+
+            metrics = {}
+            for node in nodes:
+                name = node.metadata.name
+                cpu_used, mem_used_gb = usage_by_node.get(name, (0.0, 0.0))
+                metrics[name] = _normalize_node({
+                    'is_spot': _is_spot_node(node.metadata.labels or {}),
+                    'pods': len(pods_by_node.get(name, [])),
+                    'allocatable': {
+                        'cpu': node.status.allocatable.get('cpu', '0'),
+                        'memory': node.status.allocatable.get('memory', '0Gi')
+                    },
+                    'current_cpu_usage': cpu_used,
+                    'current_mem_usage_gb': mem_used_gb
+                })
+            return metrics
+
+    # --- Informers: caché de nodos/pods alimentada por watch en lugar de listar en cada ciclo ---
+
+    def _start_informers(self):
+        """
+        Arranca los hilos de watch de nodos y pods que mantienen la caché local.
+        Con la API del kubelet los pods se leen de cada nodo y solo se vigilan los nodos.
+        """
+        self._informers_running = True
+        threading.Thread(
+            target=self._run_reflector, args=('nodes', self.api.list_node, {}), daemon=True
+        ).start()
+        if self._use_kubelet_api:
+            return
+        threading.Thread(
+            target=self._run_reflector,
+            args=('pods', self.api.list_pod_for_all_namespaces, {'field_selector': 'status.phase=Running'}),
+            daemon=True
+        ).start()
+
+    def stop_informers(self):
+        """Detiene los hilos de watch (terminan al expirar su stream actual)."""
+        self._stop_informers.set()
+
+    def _run_reflector(self, kind: str, list_func, list_kwargs: Dict):
+        """
+        Patrón reflector: lista una vez (servida desde la caché del apiserver con
+        resourceVersion=0) y después aplica solo los eventos del watch.
+        Si el resourceVersion expira (410 Gone) vuelve a listar.
+        """
+        resource_version = None
+        while not self._stop_informers.is_set():
+            try:
+                if resource_version is None:
+                    listing = list_func(resource_version='0', **list_kwargs)
+                    with self._cache_lock:
+                        self._reset_cache(kind, listing.items)
+                    resource_version = listing.metadata.resource_version
+                    self._informers_synced[kind].set()
+
+                stream = watch.Watch().stream(
+                    list_func,
+                    resource_version=resource_version,
+                    timeout_seconds=300,
+                    **list_kwargs
+                )
+                for event in stream:
+                    if event['type'] == 'ERROR':
+                        if event['raw_object'].get('code') == 410:
+                            resource_version = None
+                        break
+                    obj = event['object']
+                    with self._cache_lock:
+                        self._apply_event(kind, event['type'], obj)
+                    resource_version = obj.metadata.resource_version
+            except ApiException as e:
+                if e.status == 410:
+                    resource_version = None
+                else:
+                    log.warning("Error en watch de %s: %s. Reintentando...", kind, e)
+                    self._stop_informers.wait(5)
+            except Exception as e:
+                log.warning("Error en watch de %s: %s. Reintentando...", kind, e)
+                self._stop_informers.wait(5)
+
+    def _reset_cache(self, kind: str, items: List):
+        """Reemplaza la caché de un tipo de recurso tras un listado completo."""
+        if kind == 'nodes':
+            self._node_cache = {node.metadata.name: node for node in items}
+        else:
+            self._pod_cache_by_node = {}
+            self._pod_node_index = {}
+            for pod in items:
+                self._apply_event('pods', 'ADDED', pod)
+
+    def _apply_event(self, kind: str, event_type: str, obj):
+        """
+        Aplica un evento ADDED/MODIFIED/DELETED del watch a la caché.
+        Marca el cluster como pendiente de rebalanceo si aparece un nodo Spot,
+        desaparece un nodo (posible interrupción) o llega un pod a un nodo regular.
+        """
+        if kind == 'nodes':
+            if event_type == 'DELETED':
+                self._node_cache.pop(obj.metadata.name, None)
+                self._dirty.set()
+            else:
+                if event_type == 'ADDED' and _is_spot_node(obj.metadata.labels or {}):
+                    self._dirty.set()
+                self._node_cache[obj.metadata.name] = obj
+            return
+
+        key = (obj.metadata.namespace, obj.metadata.name)
+        previous_node = self._pod_node_index.pop(key, None)
+        if previous_node is not None:
+            self._pod_cache_by_node.get(previous_node, {}).pop(key, None)
+        if event_type != 'DELETED' and obj.spec.node_name:
+            self._pod_cache_by_node.setdefault(obj.spec.node_name, {})[key] = obj
+            self._pod_node_index[key] = obj.spec.node_name
+            node = self._node_cache.get(obj.spec.node_name)
+            if previous_node is None and node is not None and not _is_spot_node(node.metadata.labels or {}):
+                self._dirty.set()
+
+    @property
+    def _eviction_executor(self) -> ThreadPoolExecutor:
+        """Pool de las oleadas de evicción (hasta `eviction_parallelism` pods en paralelo)."""
+        if self._eviction_pool is None:
+            self._eviction_pool = ThreadPoolExecutor(max_workers=self.eviction_parallelism)
+        return self._eviction_pool
+
+    @property
+    def _api_executor(self) -> ThreadPoolExecutor:
+        """
+        Pool donde se solapan lecturas independientes de la API (listados, metrics-server, kubelets).
+        Solo el hilo que llama envía tareas: las tareas nunca esperan a otras del mismo pool.
+        """
+        if self._api_pool is None:
+            self._api_pool = ThreadPoolExecutor(max_workers=8)
+        return self._api_pool
+
+    def close(self):
+        """Libera los pools de hilos y la sesión del kubelet, si se llegaron a crear."""
+        for pool in (self._eviction_pool, self._api_pool):
+            if pool is not None:
+                pool.shutdown(wait=False)
+        self._eviction_pool = self._api_pool = None
+        if self._kubelet_session is not None:
+            self._kubelet_session.close()
+            self._kubelet_session = None
+
+    def wait_for_rebalance_trigger(self) -> bool:
+        """
+        Bloquea hasta que haya cambios relevantes en el cluster o venza REBALANCE_INTERVAL_SECONDS
+        (el intervalo es un máximo entre ciclos). Los disparos se agrupan respetando
+        REBALANCE_MIN_INTERVAL_SECONDS desde el último ciclo. Devuelve True si hubo cambios.
+        """
+        triggered = self._dirty.wait(timeout=self.config.REBALANCE_INTERVAL_SECONDS)
+        if triggered:
+            # Debounce: los eventos que lleguen durante la espera se atienden en el mismo ciclo
+            remaining = self.last_rebalance_time + self.config.REBALANCE_MIN_INTERVAL_SECONDS - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+        self._dirty.clear()
+        if triggered:
+            self._invalidate_metrics_cache()
+        return triggered
+
+    def _snapshot_cluster(self) -> Tuple[List, Dict[str, List]]:
+        """
+        Devuelve (nodos, pods en ejecución por nodo).
+        Lee de la caché de los informers si están activos; si no, consulta la API.
+        Con la API del kubelet, los pods se obtienen de cada nodo y no del apiserver.
+        """
+        if self._informers_running:
+            self._informers_synced['nodes'].wait(timeout=30)
+            if not self._use_kubelet_api:
+                self._informers_synced['pods'].wait(timeout=30)
+            with self._cache_lock:
+                nodes = list(self._node_cache.values())
+                if not self._use_kubelet_api:
+                    return nodes, {name: list(pods.values()) for name, pods in self._pod_cache_by_node.items()}
+            return nodes, self._list_pods_from_kubelets(nodes)
+
+        # resourceVersion=0 permite al apiserver responder desde su caché sin leer de etcd
+        if self._use_kubelet_api:
+            nodes = self.api.list_node(resource_version='0').items
+            return nodes, self._list_pods_from_kubelets(nodes)
+
+        # Un único listado de pods para todo el cluster (en lugar de uno por nodo), en paralelo al de nodos
+        pods_future = self._api_executor.submit(
+            self.api.list_pod_for_all_namespaces,
+            resource_version='0', field_selector='status.phase=Running', watch=False
+        )
+        nodes = self.api.list_node(resource_version='0').items
+        pods = pods_future.result().items
+        pods_by_node = defaultdict(list)
+        for pod in pods:
+            pods_by_node[pod.spec.node_name].append(pod)
+        return nodes, pods_by_node
+
+    def _configure_kubelet_session(self):
+        """
+        Prepara la sesión HTTP autenticada con el token del ServiceAccount para el puerto del kubelet.
+        El ServiceAccount necesita permiso 'get' sobre 'nodes/proxy'.
+        """
+        try:
+            with open(f"{_SERVICE_ACCOUNT_DIR}/token") as token_file:
+                token = token_file.read().strip()
+        except OSError as e:
+            log.warning("No se pudo leer el token del ServiceAccount (%s). Se usará el apiserver para listar pods.", e)
+            return
+        self._kubelet_session = requests.Session()
+        self._kubelet_session.headers['Authorization'] = f"Bearer {token}"
+        self._kubelet_session.verify = f"{_SERVICE_ACCOUNT_DIR}/ca.crt"
+        self._use_kubelet_api = True
+
+    def _list_pods_from_kubelets(self, nodes: List) -> Dict[str, List]:
+        """Pods en ejecución por nodo leídos de los kubelets (solo el propio nodo en modo DaemonSet)."""
+        futures = {
+            node.metadata.name: self._api_executor.submit(self._list_kubelet_pods, node)
+            for node in nodes
+            if not self.config.NODE_NAME or node.metadata.name == self.config.NODE_NAME
+        }
+        pods_by_node = {}
+        for name, future in futures.items():
+            try:
+                pods_by_node[name] = future.result()
+            except requests.RequestException as e:
+                log.warning("No se pudieron obtener los pods del kubelet de %s: %s", name, e)
+        return pods_by_node
+
+    def _list_kubelet_pods(self, node) -> List:
+        """Consulta el endpoint /pods del kubelet de un nodo y devuelve sus pods en ejecución."""
+        address = next(
+            (a.address for a in (node.status.addresses or []) if a.type == 'InternalIP'),
+            node.metadata.name
+        )
+        response = self._kubelet_session.get(
+            f"https://{address}:{self.config.KUBELET_PORT}/pods", timeout=10
+        )
+        response.raise_for_status()
+        pod_list = self.api.api_client.deserialize(SimpleNamespace(data=response.text), 'V1PodList')
+        return [pod for pod in pod_list.items if pod.status and pod.status.phase == 'Running']
+
+    def _get_node_usage(self) -> Dict[str, Tuple[float, float]]:
+        """
+        Obtiene el uso real (CPU en cores, memoria en GiB) de cada nodo desde metrics-server.
+        Devuelve un diccionario vacío si metrics.k8s.io no está disponible.
+        """
+        try:
+            node_metrics = self.custom_api.list_cluster_custom_object(
+                group="metrics.k8s.io", version="v1beta1", plural="nodes"
+            )
+            return {
+                item['metadata']['name']: (
+                    _parse_cpu(item['usage']['cpu']),
+                    _parse_memory_gb(item['usage']['memory'])
+                )
+                for item in node_metrics.get('items', [])
+            }
+        except Exception as e:
+            log.warning("No se pudieron obtener métricas de metrics.k8s.io: %s", e)
+            return {}
 
     def find_pods_for_rebalance(self) -> List[Dict]:
         """
@@ -213,54 +657,54 @@ class ClusterRebalancer:
         En modo real, interactúa con la API de Kubernetes para encontrar pods elegibles.
         """
         if self.simulation_mode:
-            regular_node_pods = self.simulated_nodes.get('aks-regular-1', {}).get('pods', [])
-            candidates = []
-            for pod in regular_node_pods:
-                # Para la simulación, nos basta con que no sea crítico y esté en un nodo regular.
-                if pod.get('labels', {}).get('critical') == 'false':
-                    candidates.append(pod)
-            return candidates
+            # Para la simulación, nos basta con que no sea crítico y esté en un nodo regular.
+            return self._noncritical_pods_on('aks-regular-1')
         else:
             # --- LÓGICA DE PRODUCCIÓN REAL: Buscar pods elegibles de Kubernetes ---
-            # Implementar para listar pods, filtrar por etiquetas/afinidades,
-            # y determinar si están en un nodo regular que podría ir a Spot.
-            # Ejemplo:
-            # all_pods = self.api.list_pod_for_all_namespaces().items
-            # eligible_pods = []
-            # for pod in all_pods:
-            #     # Check if pod is running on a non-spot node
-            #     # Check if pod has affinity for spot nodes (e.g., nodeAffinity)
-            #     # Check if pod is not critical (based on labels)
-            #     pass
-            # return eligible_pods
-            logging.error("Función find_pods_for_rebalance en modo producción no implementada.")
-            return []
+            # Pods en ejecución y no críticos de los nodos regulares
+            nodes, pods_by_node = self._snapshot_cluster()
+            eligible_pods = []
+            for node in nodes:
+                if _is_spot_node(node.metadata.labels or {}):
+                    continue
+                for pod in pods_by_node.get(node.metadata.name, []):
+                    if (pod.metadata.labels or {}).get('critical') == 'true':
+                        continue
+                    # Como kubectl drain: sin controlador nadie recrearía el pod; los de DaemonSet
+                    # no se pueden mover a otro nodo y los estáticos (mirror, dueño Node) no se desalojan
+                    owners = pod.metadata.owner_references or []
+                    controller = next((owner for owner in owners if owner.controller), None)
+                    if controller is None or controller.kind in ('DaemonSet', 'Node'):
+                        continue
+                    try:
+                        eligible_pods.append(_pod_to_dict(pod))
+                    except ValueError as e:
+                        # Una cantidad no reconocida no debe abortar todo el ciclo
+                        log.warning("Pod %s omitido: requests no válidas (%s)", pod.metadata.name, e)
+            return eligible_pods
 
 
-    def _calculate_pod_priority(self, pod: Dict) -> float:
+    def _calculate_pod_priority(self, pod: Dict, now: Optional[float] = None) -> float:
         """
         Calcula prioridad para rebalanceo (mayor valor = más prioritario)
         Criterios:
         - Pods no críticos (mayor peso)
         - Antigüedad del pod (más viejo primero)
         - Menor consumo de recursos (favorece mover pods más pequeños)
+        `now` permite reutilizar el mismo instante al puntuar un lote de pods.
         """
         priority = 0
+        if now is None:
+            now = time.time()
         
-        if pod.get('labels', {}).get('critical', 'false') == 'false':
+        if not pod['_critical']:
             priority += 5 
             
-        if time.time() - pod.get('creation_timestamp', 0) > 3600:
+        if now - pod.get('creation_timestamp', 0) > 3600:
             priority += 1
             
-        cpu_req = float(pod['resources']['requests']['cpu'].replace('m', ''))
-        if 'm' in pod['resources']['requests']['cpu']:
-            cpu_req /= 1000.0 
-        
-        mem_req_gb = float(pod['resources']['requests']['memory'].replace('Gi', ''))
-        
-        cpu_priority_factor = 1 - min(cpu_req / 2.0, 1.0) 
-        mem_priority_factor = 1 - min(mem_req_gb / 4.0, 1.0)
+        cpu_priority_factor = 1 - min(pod['_cpu_req'] / 2.0, 1.0) 
+        mem_priority_factor = 1 - min(pod['_mem_req_gb'] / 4.0, 1.0)
         
         priority += (cpu_priority_factor + mem_priority_factor) * 0.5 
         
@@ -274,135 +718,198 @@ class ClusterRebalancer:
         if not pods:
             return []
             
-        prioritized_pods = []
-        for pod in pods:
-            if pod.get('labels', {}).get('critical') == 'true':
-                continue 
-            
-            score = self._calculate_pod_priority(pod)
-            prioritized_pods.append((pod, score))
+        # Un único instante para todo el lote y selección parcial (top-k) en lugar de ordenar todo
+        now = time.time()
+        prioritized_pods = (
+            (pod, self._calculate_pod_priority(pod, now))
+            for pod in pods
+            if not pod['_critical']
+        )
+        top_pods = heapq.nlargest(self.max_pods_per_cycle, prioritized_pods, key=lambda x: x[1])
         
-        prioritized_pods.sort(key=lambda x: x[1], reverse=True)
-        
-        return [p[0] for p in prioritized_pods[:self.max_pods_per_cycle]]
+        return [p[0] for p in top_pods]
 
     def _select_target_nodes(self, node_metrics: Dict) -> List[Tuple[str, float]]:
         """
         Selecciona y prioriza nodos destino (solo Spot).
         Considera la capacidad disponible y el uso actual para un balance más inteligente.
+        Devuelve como máximo max_pods_per_cycle nodos (nunca se moverán más pods que eso).
         """
-        scored_nodes = []
-        
-        for name, info in node_metrics.items():
-            if info.get('is_spot', False):
-                cpu_capacity = float(info['allocatable']['cpu'])
-                mem_capacity_gb = float(info['allocatable']['memory'].replace('Gi', ''))
+        limit = self.max_pods_per_cycle
+        if self.simulation_mode:
+            # Los mejores nodos salen del heap; las entradas obsoletas se descartan al extraerlas
+            scored_nodes = []
+            while self._spot_heap and len(scored_nodes) < limit:
+                neg_score, name = heapq.heappop(self._spot_heap)
+                if self._spot_scores.get(name) == -neg_score and \
+                   all(name != selected for selected, _ in scored_nodes):
+                    scored_nodes.append((name, -neg_score))
+            for name, score in scored_nodes:
+                heapq.heappush(self._spot_heap, (-score, name))
+            return scored_nodes
 
-                cpu_utilization = info['current_cpu_usage'] / cpu_capacity if cpu_capacity > 0 else 1.0
-                mem_utilization = info['current_mem_usage_gb'] / mem_capacity_gb if mem_capacity_gb > 0 else 1.0
+        # Una sola pasada sobre valores ya convertidos, sin llamadas intermedias por nodo
+        scored_nodes = (
+            (name, _spot_target_score(
+                info['_cpu_alloc'], info['_mem_alloc_gb'],
+                info['current_cpu_usage'], info['current_mem_usage_gb']
+            ))
+            for name, info in node_metrics.items()
+            if info.get('is_spot', False)
+        )
+        return heapq.nlargest(limit, scored_nodes, key=lambda x: x[1])
 
-                utilization_factor = ((1 - cpu_utilization) + (1 - mem_utilization)) / 2.0 
-                
-                base_capacity_score = calculate_node_score(info) 
-                
-                score = base_capacity_score * (1 + utilization_factor * 2) 
-                
-                scored_nodes.append((name, score))
-        
-        return sorted(scored_nodes, key=lambda x: x[1], reverse=True)
+    def _plan_placements(self, pods: List[Dict], target_nodes: List[Tuple[str, float]],
+                         node_metrics: Dict[str, Dict]) -> List[Tuple[Dict, str]]:
+        """
+        Asigna pods a nodos destino con best-fit decreasing en dos dimensiones (CPU y memoria).
+        La capacidad libre de cada nodo sale de node_metrics (asignable menos uso actual).
+        Los pods se recorren de mayor a menor CPU solicitada y cada uno va al nodo
+        donde, cabiendo en CPU y memoria, deja menos CPU libre. Los pods que no caben
+        en ningún nodo no se incluyen, evitando evicciones inútiles.
+        """
+        free_capacity = {}
+        for name, _ in target_nodes:
+            node = node_metrics.get(name)
+            if node:
+                free_capacity[name] = [
+                    node['_cpu_alloc'] - node['current_cpu_usage'],
+                    node['_mem_alloc_gb'] - node['current_mem_usage_gb']
+                ]
+
+        placements = []
+        by_cpu_desc = sorted(map(_normalize_pod, pods), key=lambda p: p['_cpu_req'], reverse=True)
+        for pod in by_cpu_desc:
+            cpu_req = pod['_cpu_req']
+            mem_req = pod['_mem_req_gb']
+
+            best_node, best_slack = None, None
+            for name, (cpu_free, mem_free) in free_capacity.items():
+                if cpu_req <= cpu_free and mem_req <= mem_free:
+                    slack = cpu_free - cpu_req
+                    if best_slack is None or slack < best_slack:
+                        best_node, best_slack = name, slack
+
+            if best_node is None:
+                log.warning("Ningún nodo Spot tiene capacidad para el pod %s. Se mantiene en su nodo.", pod['name'])
+                continue
+
+            free_capacity[best_node][0] -= cpu_req
+            free_capacity[best_node][1] -= mem_req
+            placements.append((pod, best_node))
+        return placements
 
-    def _execute_migrations(self, pods: List[Dict], target_nodes: List[Tuple[str, float]]):
+    def _execute_migrations(self, pods: List[Dict], target_nodes: List[Tuple[str, float]],
+                            node_metrics: Dict[str, Dict]):
         """
         Ejecuta la migración de pods a nodos destino.
+        Solo se migran los pods que _plan_placements puede colocar en algún nodo Spot.
         En modo simulación, actualiza el estado interno.
         En modo real, utiliza la API de Kubernetes para desalojar pods.
         """
         if not target_nodes:
-            logging.info("[SIMULACIÓN] No hay nodos Spot disponibles para migración.")
+            log.info("[SIMULACIÓN] No hay nodos Spot disponibles para migración.")
             return
 
+        placements = self._plan_placements(pods, target_nodes, node_metrics)
         if self.simulation_mode:
-            node_cycle_idx = 0
-            for pod in pods:
-                try:
-                    target_node_name = target_nodes[node_cycle_idx % len(target_nodes)][0]
-                    node_cycle_idx += 1 
-                except IndexError:
-                    logging.warning("[SIMULACIÓN] No hay nodos Spot en la lista de destino. No se puede mover el pod.")
-                    break 
-
-                pod_priority = self._calculate_pod_priority(pod)
-                
+            for pod, target_node_name in placements:
                 if not safe_evict_pod(pod['name'], pod['namespace'], pod['labels']):
-                    logging.warning(f"[SIMULACIÓN] No se pudo migrar el pod {pod['name']} debido a restricciones de PDB.")
+                    log.warning("[SIMULACIÓN] No se pudo migrar el pod %s debido a restricciones de PDB.", pod['name'])
                     continue
 
-                logging.info(
-                    f"[SIMULACIÓN] Moviendo pod {pod['name']} "
-                    f"(Prioridad: {pod_priority:.2f}, CPU: {pod['resources']['requests']['cpu']}) "
-                    f"a {target_node_name}"
-                )
+                if log.isEnabledFor(logging.INFO):
+                    # La prioridad solo se calcula para el log
+                    log.info(
+                        "[SIMULACIÓN] Moviendo pod %s (Prioridad: %.2f, CPU: %s) a %s",
+                        pod['name'], self._calculate_pod_priority(pod),
+                        pod['resources']['requests']['cpu'], target_node_name
+                    )
                 
-                original_node_name = None
-                found_pod = False
-                for n_name, n_info in self.simulated_nodes.items():
-                    new_pod_list = [p for p in n_info.get('pods', []) if p['name'] != pod['name']]
-                    if len(new_pod_list) < len(n_info.get('pods', [])):
-                        original_node_name = n_name
-                        n_info['pods'] = new_pod_list
-                        self._update_simulated_node_usage(n_name) 
-                        found_pod = True
-                        break
-                
-                if not found_pod:
-                    logging.warning(f"[SIMULACIÓN] Pod {pod['name']} no encontrado en ningún nodo para mover. Saltando.")
+                original_node_name = self._pod_to_node.pop(pod['name'], None)
+                if original_node_name not in self.simulated_nodes:
+                    log.warning("[SIMULACIÓN] Pod %s no encontrado en ningún nodo para mover. Saltando.", pod['name'])
                     continue
+                
+                self.simulated_nodes[original_node_name]['pods'].pop(pod['name'], None)
+                self._apply_delta(original_node_name, -pod['_cpu_req'], -pod['_mem_req_gb'])
 
                 if target_node_name in self.simulated_nodes:
-                    self.simulated_nodes[target_node_name].setdefault('pods', []).append(pod)
-                    self._update_simulated_node_usage(target_node_name) 
-                    logging.info(f"[SIMULACIÓN] Pod {pod['name']} movido exitosamente a {target_node_name}")
+                    self.simulated_nodes[target_node_name].setdefault('pods', {})[pod['name']] = pod
+                    self._track_pod(pod, target_node_name)
+                    self._apply_delta(target_node_name, pod['_cpu_req'], pod['_mem_req_gb'])
+                    log.info("[SIMULACIÓN] Pod %s movido exitosamente a %s", pod['name'], target_node_name)
                 else:
-                    logging.error(f"[SIMULACIÓN] ERROR: Nodo destino {target_node_name} no encontrado en simulación.")
+                    log.error("[SIMULACIÓN] ERROR: Nodo destino %s no encontrado en simulación.", target_node_name)
         else:
             # --- LÓGICA DE PRODUCCIÓN REAL: Ejecutar expulsión de pods de Kubernetes ---
-            # Implementar la lógica para desalojar el pod usando self.policy_api
-            # y manejar PodDisruptionBudgets (PDBs)
-            # Ejemplo:
-            # for pod in pods:
-            #     body = client.V1Eviction(
-            #         api_version="policy/v1",
-            #         kind="Eviction",
-            #         delete_options=client.V1DeleteOptions(),
-            #         metadata=client.V1ObjectMeta(name=pod['name'], namespace=pod['namespace'])
-            #     )
-            #     try:
-            #         self.policy_api.create_namespaced_pod_eviction(name=pod['name'], namespace=pod['namespace'], body=body)
-            #         logging.info(f"Pod {pod['name']} desalojado exitosamente.")
-            #     except ApiException as e:
-            #         if e.status == 429: # Too Many Requests, often due to PDB
-            #             logging.warning(f"No se pudo desalojar pod {pod['name']} debido a PDB o limitación de rate: {e.reason}")
-            #         else:
-            #             logging.error(f"Error al desalojar pod {pod['name']}: {e}")
-            logging.error("Función _execute_migrations en modo producción no implementada.")
+            # El scheduler decide el nodo destino; aquí solo se desalojan, en oleadas paralelas,
+            # los pods que caben en algún nodo Spot según el plan
+            pods = [pod for pod, _ in placements]
+            evicted = 0
+            for start in range(0, len(pods), self.eviction_parallelism):
+                if start:
+                    time.sleep(self.eviction_window_ms / 1000.0)
+                wave = pods[start:start + self.eviction_parallelism]
+                futures = {self._eviction_executor.submit(self._evict_pod, pod): pod for pod in wave}
+                for future in as_completed(futures):
+                    if future.result():
+                        evicted += 1
+            log.info("Evicciones completadas: %s/%s pods desalojados.", evicted, len(pods))
+        
+        self._invalidate_metrics_cache()
+
+    def _evict_pod(self, pod: Dict) -> bool:
+        """
+        Desaloja un pod mediante la API de Eviction (respeta los PodDisruptionBudgets).
+        Un 429 indica que el PDB no permite la interrupción todavía o que hay rate limit:
+        se reintenta con backoff exponencial y jitter hasta `eviction_max_retries` veces.
+        """
+        body = client.V1Eviction(
+            api_version="policy/v1",
+            kind="Eviction",
+            delete_options=client.V1DeleteOptions(),
+            metadata=client.V1ObjectMeta(name=pod['name'], namespace=pod['namespace'])
+        )
+        for attempt in range(self.eviction_max_retries + 1):
+            try:
+                self.api.create_namespaced_pod_eviction(name=pod['name'], namespace=pod['namespace'], body=body)
+                log.info("Pod %s desalojado exitosamente.", pod['name'])
+                return True
+            except ApiException as e:
+                if e.status != 429:
+                    log.error("Error al desalojar pod %s: %s", pod['name'], e)
+                    return False
+                if attempt == self.eviction_max_retries:
+                    log.warning("No se pudo desalojar pod %s debido a PDB o limitación de rate: %s", pod['name'], e.reason)
+                    return False
+                wait_time = (2 ** attempt) * 0.5 + random.uniform(0, 0.5)
+                log.info("Evicción de %s rechazada (429), reintentando en %.1fs", pod['name'], wait_time)
+                time.sleep(wait_time)
+        return False
 
     def simulate_spot_node_interruption(self, node_name: str):
         """
         Simula la interrupción de un nodo Spot.
         Mueve sus pods a otros nodos Spot disponibles o a un nodo regular como fallback.
+        Los pods se reprograman de mayor a menor CPU con best-fit: cada uno va al nodo Spot
+        donde, cabiendo en CPU y memoria, deja menos CPU libre.
         """
         if node_name not in self.simulated_nodes or not self.simulated_nodes[node_name]['is_spot']:
-            logging.warning(f"No se puede simular interrupción: '{node_name}' no es un nodo Spot o no existe actualmente.")
+            log.warning("No se puede simular interrupción: '%s' no es un nodo Spot o no existe actualmente.", node_name)
             return
 
-        logging.info(f"\n--- SIMULANDO INTERRUPCIÓN DEL NODO SPOT: {node_name} ---")
+        log.info("\n--- SIMULANDO INTERRUPCIÓN DEL NODO SPOT: %s ---", node_name)
         
-        interrupted_node_pods = self.simulated_nodes[node_name]['pods'][:] 
+        interrupted_node_pods = list(self.simulated_nodes[node_name]['pods'].values())
         
-        logging.info(f"Eliminando nodo '{node_name}' de la simulación.")
+        log.info("Eliminando nodo '%s' de la simulación.", node_name)
         del self.simulated_nodes[node_name]
+        self._spot_scores.pop(node_name, None)  # sus entradas del heap quedan obsoletas
+        for pod in interrupted_node_pods:
+            self._untrack_pod(pod)
         
-        logging.info(f"Nodos restantes en la simulación: {list(self.simulated_nodes.keys())}")
+        log.info("Nodos restantes en la simulación: %s", list(self.simulated_nodes.keys()))
 
         remaining_spot_nodes_names = [
             n_name for n_name, n_info in self.simulated_nodes.items() 
@@ -411,49 +918,49 @@ class ClusterRebalancer:
 
         fallback_node_name = 'aks-regular-1' 
 
-        for pod in interrupted_node_pods:
+        for pod in sorted(interrupted_node_pods, key=lambda p: p['_cpu_req'], reverse=True):
             target_node_for_reprogram = None
-            target_node_id = None # Almacena el nombre del nodo para pasarlo a _update_simulated_node_usage
+            target_node_id = None # Almacena el nombre del nodo para pasarlo a _apply_delta
             
-            # Buscar un nodo Spot elegible (con capacidad)
-            eligible_spot_nodes_with_capacity = []
+            # Buscar el nodo Spot con capacidad que quede más ajustado (best-fit)
+            best_slack = None
             for n_name in remaining_spot_nodes_names:
                 node_info = self.simulated_nodes[n_name]
-                cpu_req = float(pod['resources']['requests']['cpu'].replace('m', '')) / 1000
-                mem_req = float(pod['resources']['requests']['memory'].replace('Gi', ''))
+                cpu_slack = node_info['_cpu_alloc'] - node_info['current_cpu_usage'] - pod['_cpu_req']
                 
-                if (node_info['current_cpu_usage'] + cpu_req <= float(node_info['allocatable']['cpu'])) and \
-                   (node_info['current_mem_usage_gb'] + mem_req <= float(node_info['allocatable']['memory'].replace('Gi', ''))):
-                    eligible_spot_nodes_with_capacity.append(n_name)
+                if cpu_slack >= 0 and \
+                   (node_info['current_mem_usage_gb'] + pod['_mem_req_gb'] <= node_info['_mem_alloc_gb']) and \
+                   (best_slack is None or cpu_slack < best_slack):
+                    target_node_id, best_slack = n_name, cpu_slack
             
-            if eligible_spot_nodes_with_capacity:
-                target_node_id = random.choice(eligible_spot_nodes_with_capacity) # Simula que el scheduler elige
+            if target_node_id is not None:
                 target_node_for_reprogram = self.simulated_nodes[target_node_id]
-                logging.info(f"[SIMULACIÓN Fallback] Pod {pod['name']} (de {node_name}) se reprograma a '{target_node_id}' (Otro Spot disponible).")
+                log.info("[SIMULACIÓN Fallback] Pod %s (de %s) se reprograma a '%s' (Otro Spot disponible).", pod['name'], node_name, target_node_id)
             elif fallback_node_name in self.simulated_nodes and not self.simulated_nodes[fallback_node_name]['is_spot']:
                 # Si no hay nodos Spot elegibles, usar el nodo regular de fallback (si tiene capacidad)
                 target_node_id = fallback_node_name
                 target_node_for_reprogram = self.simulated_nodes[target_node_id]
-                cpu_req = float(pod['resources']['requests']['cpu'].replace('m', '')) / 1000
-                mem_req = float(pod['resources']['requests']['memory'].replace('Gi', ''))
                 
-                if (target_node_for_reprogram['current_cpu_usage'] + cpu_req <= float(target_node_for_reprogram['allocatable']['cpu'])) and \
-                   (target_node_for_reprogram['current_mem_usage_gb'] + mem_req <= float(target_node_for_reprogram['allocatable']['memory'].replace('Gi', ''))):
-                    logging.info(f"[SIMULACIÓN Fallback] Pod {pod['name']} (de {node_name}) se reprograma a '{target_node_id}' (Regular, por falta de Spots o capacidad).")
+                if (target_node_for_reprogram['current_cpu_usage'] + pod['_cpu_req'] <= target_node_for_reprogram['_cpu_alloc']) and \
+                   (target_node_for_reprogram['current_mem_usage_gb'] + pod['_mem_req_gb'] <= target_node_for_reprogram['_mem_alloc_gb']):
+                    log.info("[SIMULACIÓN Fallback] Pod %s (de %s) se reprograma a '%s' (Regular, por falta de Spots o capacidad).", pod['name'], node_name, target_node_id)
                 else:
-                    logging.warning(f"[SIMULACIÓN Fallback] Nodo fallback '{fallback_node_name}' sin capacidad para pod {pod['name']}. No se puede reprogramar.")
+                    log.warning("[SIMULACIÓN Fallback] Nodo fallback '%s' sin capacidad para pod %s. No se puede reprogramar.", fallback_node_name, pod['name'])
                     target_node_for_reprogram = None # No hay capacidad, no se puede reprogramar
             else:
-                logging.error(f"[SIMULACIÓN Fallback] No hay nodos disponibles (Spot o Regular con capacidad) para reprogramar el pod {pod['name']} de {node_name}.")
+                log.error("[SIMULACIÓN Fallback] No hay nodos disponibles (Spot o Regular con capacidad) para reprogramar el pod %s de %s.", pod['name'], node_name)
                 continue
 
             if target_node_for_reprogram:
-                target_node_for_reprogram.setdefault('pods', []).append(pod)
-                self._update_simulated_node_usage(target_node_id) # Usar target_node_id aquí
+                target_node_for_reprogram.setdefault('pods', {})[pod['name']] = pod
+                self._track_pod(pod, target_node_id)
+                self._apply_delta(target_node_id, pod['_cpu_req'], pod['_mem_req_gb'])
             else:
-                logging.error(f"[SIMULACIÓN Fallback] Pod {pod['name']} de {node_name} NO PUDO SER REPROGRAMADO en ningún nodo con capacidad.")
+                log.error("[SIMULACIÓN Fallback] Pod %s de %s NO PUDO SER REPROGRAMADO en ningún nodo con capacidad.", pod['name'], node_name)
         
-        logging.info(f"--- SIMULACIÓN DE INTERRUPCIÓN DE NODO FINALIZADA ({node_name}) ---\n")
+        self._invalidate_metrics_cache()
+        self._dirty.set()
+        log.info("--- SIMULACIÓN DE INTERRUPCIÓN DE NODO FINALIZADA (%s) ---\n", node_name)
 
     def rebalance_cluster(self):
         """
@@ -461,52 +968,64 @@ class ClusterRebalancer:
         """
         # Aquí puedes añadir una verificación si KUBERNETES_AVAILABLE es False y simulation_mode es False
         # Para evitar que intente operar en producción sin los módulos.
+        # El ritmo de ejecución lo marca wait_for_rebalance_trigger.
         
-        if time.time() - self.last_rebalance_time < self.config.REBALANCE_INTERVAL_SECONDS:
-            logging.info(f"Esperando para próximo ciclo de rebalanceo (mínimo {self.config.REBALANCE_INTERVAL_SECONDS} segundos)")
-            return
-            
         try:
-            logging.info("\n=== INICIANDO CICLO DE REBALANCEO ===\n")
+            log.info("\n=== INICIANDO CICLO DE REBALANCEO ===\n")
             
             node_metrics = self.get_node_metrics()
-            logging.info("Estado inicial de nodos:")
-            for name, info in node_metrics.items():
-                spot_status = "Spot" if info['is_spot'] else "Regular"
-                logging.info(f"- {name}: {spot_status} (Pods: {info['pods']}, CPU Usado: {info['current_cpu_usage']:.2f}/{float(info['allocatable']['cpu']):.0f}, Mem Usado: {info['current_mem_usage_gb']:.2f}/{float(info['allocatable']['memory'].replace('Gi','')):.0f}Gi)")
+            if log.isEnabledFor(logging.INFO):
+                log.info("Estado inicial de nodos:")
+                self._log_node_states(node_metrics)
             
             pods_to_move = self.find_pods_for_rebalance()
-            logging.info(f"\nPods candidatos encontrados en nodos regulares: {len(pods_to_move)}")
+            log.info("\nPods candidatos encontrados en nodos regulares: %s", len(pods_to_move))
             
             filtered_pods = self._filter_pods(pods_to_move, node_metrics)
-            logging.info(f"Pods seleccionados para mover: {len(filtered_pods)}")
+            log.info("Pods seleccionados para mover: %s", len(filtered_pods))
             
             target_nodes = self._select_target_nodes(node_metrics)
-            logging.info("\nNodos destino Spot priorizados:")
-            if not target_nodes:
-                logging.info("- No hay nodos Spot disponibles o con capacidad.")
-            for node, score in target_nodes:
-                node_info = node_metrics.get(node, {})
-                logging.info(f"- {node}: Score {score:.2f} (Pods: {node_info.get('pods', 0)}, CPU Usado: {node_info.get('current_cpu_usage',0):.2f}, Mem Usado: {node_info.get('current_mem_usage_gb',0):.2f}Gi)")
+            if log.isEnabledFor(logging.INFO):
+                log.info("\nNodos destino Spot priorizados:")
+                if not target_nodes:
+                    log.info("- No hay nodos Spot disponibles o con capacidad.")
+                for node, score in target_nodes:
+                    node_info = node_metrics.get(node, {})
+                    log.info(
+                        "- %s: Score %.2f (Pods: %s, CPU Usado: %.2f, Mem Usado: %.2fGi)",
+                        node, score, node_info.get('pods', 0),
+                        node_info.get('current_cpu_usage', 0), node_info.get('current_mem_usage_gb', 0)
+                    )
             
             if filtered_pods and target_nodes:
-                logging.info("\nIniciando migraciones...")
-                self._execute_migrations(filtered_pods, target_nodes)
+                log.info("\nIniciando migraciones...")
+                self._execute_migrations(filtered_pods, target_nodes, node_metrics)
             else:
-                logging.info("\nNo hay pods para mover o no hay nodos Spot disponibles/aptos.")
+                log.info("\nNo hay pods para mover o no hay nodos Spot disponibles/aptos.")
             
             self.last_rebalance_time = time.time()
             
-            logging.info("\nResumen de cambios después de migraciones:")
-            node_metrics = self.get_node_metrics()
-            for name, info in node_metrics.items():
-                spot_status = "Spot" if info['is_spot'] else "Regular"
-                logging.info(f"- {name}: {spot_status} (Pods: {info['pods']}, CPU Usado: {info['current_cpu_usage']:.2f}/{float(info['allocatable']['cpu']):.0f}, Mem Usado: {info['current_mem_usage_gb']:.2f}/{float(info['allocatable']['memory'].replace('Gi','')):.0f}Gi)")
+            if log.isEnabledFor(logging.INFO):
+                # Las métricas posteriores solo se consultan para el resumen
+                log.info("\nResumen de cambios después de migraciones:")
+                self._log_node_states(self.get_node_metrics())
             
-            logging.info("\n=== CICLO DE REBALANCEO COMPLETADO ===\n")
+            log.info("\n=== CICLO DE REBALANCEO COMPLETADO ===\n")
             
         except Exception as e:
-            logging.error(f"Error durante rebalanceo: {str(e)}", exc_info=True)
+            # La traza completa solo en DEBUG: un fallo transitorio de la API no merece un traceback por ciclo
+            log.error("Error durante rebalanceo: %s", e, exc_info=log.isEnabledFor(logging.DEBUG))
+
+    @staticmethod
+    def _log_node_states(node_metrics: Dict[str, Dict]):
+        """Escribe en el log el estado (tipo, pods y uso) de cada nodo."""
+        for name, info in node_metrics.items():
+            log.info(
+                "- %s: %s (Pods: %s, CPU Usado: %.2f/%.0f, Mem Usado: %.2f/%.0fGi)",
+                name, "Spot" if info['is_spot'] else "Regular", info['pods'],
+                info['current_cpu_usage'], info['_cpu_alloc'],
+                info['current_mem_usage_gb'], info['_mem_alloc_gb']
+            )
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -516,49 +1035,49 @@ if __name__ == "__main__":
     
     rebalancer = ClusterRebalancer(simulation_mode=True) # Siempre en simulación para esta demo
     
-    logging.info("=== MODO SIMULACIÓN ACTIVADO (Sin conexión real) ===")
-    logging.info(f"El rebalanceo se ejecutará cada {Config().REBALANCE_INTERVAL_SECONDS} segundos. Presiona Ctrl+C para detener.")
+    log.info("=== MODO SIMULACIÓN ACTIVADO (Sin conexión real) ===")
+    log.info("El rebalanceo se ejecutará ante cambios del clúster o como máximo cada %s segundos. Presiona Ctrl+C para detener.", Config().REBALANCE_INTERVAL_SECONDS)
     
     try:
         # --- Objetivo: Al menos un servicio desplegado con éxito en nodos Spot. ---
         # 1. Mostrar estado inicial (todos los pods en aks-regular-1)
-        logging.info("\n--- VALIDACIÓN DE OBJETIVO: Despliegue en Nodos Spot ---")
-        logging.info("Estado inicial del clúster (antes del rebalanceo):")
+        log.info("\n--- VALIDACIÓN DE OBJETIVO: Despliegue en Nodos Spot ---")
+        log.info("Estado inicial del clúster (antes del rebalanceo):")
         node_metrics_initial = rebalancer.get_node_metrics()
         for name, info in node_metrics_initial.items():
             spot_status = "Spot" if info['is_spot'] else "Regular"
-            logging.info(f"Nodo {name}: {spot_status} (Pods: {info['pods']})")
+            log.info("Nodo %s: %s (Pods: %s)", name, spot_status, info['pods'])
         
         # 2. Ejecutar el rebalanceo inicial para mover pods a Spot
-        logging.info("\n--- Ejecutando Rebalanceo para Mover Pods a Nodos Spot ---")
+        log.info("\n--- Ejecutando Rebalanceo para Mover Pods a Nodos Spot ---")
         rebalancer.rebalance_cluster()
         
         # 3. Validar el estado después del rebalanceo (pods en Spot)
-        logging.info("\n--- Estado del clúster DESPUÉS del rebalanceo inicial ---")
+        log.info("\n--- Estado del clúster DESPUÉS del rebalanceo inicial ---")
         node_metrics_after_rebalance = rebalancer.get_node_metrics()
         spot_nodes_with_pods = 0
         for name, info in node_metrics_after_rebalance.items():
             spot_status = "Spot" if info['is_spot'] else "Regular"
-            logging.info(f"Nodo {name}: {spot_status} (Pods: {info['pods']})")
+            log.info("Nodo %s: %s (Pods: %s)", name, spot_status, info['pods'])
             if info['is_spot'] and info['pods'] > 0:
                 spot_nodes_with_pods += 1
         
         if spot_nodes_with_pods > 0:
-            logging.info(f"\nVALIDACIÓN: ¡Éxito! Se han desplegado pods en al menos {spot_nodes_with_pods} nodo(s) Spot.")
+            log.info("\nVALIDACIÓN: ¡Éxito! Se han desplegado pods en al menos %s nodo(s) Spot.", spot_nodes_with_pods)
         else:
-            logging.warning("\nVALIDACIÓN: No se han desplegado pods en nodos Spot. Revisa la lógica de rebalanceo.")
+            log.warning("\nVALIDACIÓN: No se han desplegado pods en nodos Spot. Revisa la lógica de rebalanceo.")
 
-        logging.info("\n--- Preparando simulación de interrupción de nodo Spot (pausa de 5 segundos) ---\n")
+        log.info("\n--- Preparando simulación de interrupción de nodo Spot (pausa de 5 segundos) ---\n")
         time.sleep(5) 
 
         # --- Objetivo: Ante una interrupción de nodo Spot, el servicio debe reprogramarse automáticamente. ---
         # 4. Simular la interrupción de un nodo Spot (ej. aks-spot-1)
-        logging.info("\n--- VALIDACIÓN DE OBJETIVO: Resiliencia ante Interrupción de Nodo Spot ---")
-        logging.info("Simulando interrupción del nodo Spot 'aks-spot-1'...")
+        log.info("\n--- VALIDACIÓN DE OBJETIVO: Resiliencia ante Interrupción de Nodo Spot ---")
+        log.info("Simulando interrupción del nodo Spot 'aks-spot-1'...")
         rebalancer.simulate_spot_node_interruption('aks-spot-1')
         
         # 5. Mostrar el estado del clúster DESPUÉS de la interrupción simulada y fallback
-        logging.info("\n--- Estado del clúster DESPUÉS de la interrupción simulada y fallback ---")
+        log.info("\n--- Estado del clúster DESPUÉS de la interrupción simulada y fallback ---")
         node_metrics_after_interruption = rebalancer.get_node_metrics()
         
         # Validar el rebalanceo de los pods del nodo interrumpido
@@ -567,23 +1086,25 @@ if __name__ == "__main__":
         
         for name, info in node_metrics_after_interruption.items():
             spot_status = "Spot" if info['is_spot'] else "Regular"
-            logging.info(f"Nodo {name}: {spot_status} (Pods: {info['pods']})")
+            log.info("Nodo %s: %s (Pods: %s)", name, spot_status, info['pods'])
         
         # Una validación más profunda requeriría rastrear cada pod, pero los logs ya muestran el movimiento.
-        logging.info("\nVALIDACIÓN: La simulación muestra que los pods del nodo Spot interrumpido fueron movidos a otros nodos (Spot o Regular).")
-        logging.info(f"Cantidad de pods en nodo regular de fallback ('aks-regular-1'): {pods_in_fallback_node}")
+        log.info("\nVALIDACIÓN: La simulación muestra que los pods del nodo Spot interrumpido fueron movidos a otros nodos (Spot o Regular).")
+        log.info("Cantidad de pods en nodo regular de fallback ('aks-regular-1'): %s", pods_in_fallback_node)
 
-        logging.info("\n--- Simulación Completa de Rebalanceo e Interrupción Finalizada ---")
+        log.info("\n--- Simulación Completa de Rebalanceo e Interrupción Finalizada ---")
         
         # Bucle principal para la ejecución cíclica
-        logging.info("\n--- Iniciando el ciclo de ejecución continua del rebalanceador ---")
+        log.info("\n--- Iniciando el ciclo de ejecución continua del rebalanceador ---")
         while True:
+            rebalancer.wait_for_rebalance_trigger()
             rebalancer.rebalance_cluster()
-            time.sleep(rebalancer.config.REBALANCE_INTERVAL_SECONDS)
             
     except KeyboardInterrupt:
-        logging.info("\nSimulación detenida manualmente")
+        log.info("\nSimulación detenida manualmente")
     except Exception as e:
-        logging.error(f"Error fatal durante la simulación: {str(e)}", exc_info=True)
+        log.error("Error fatal durante la simulación: %s", e, exc_info=True)
+    finally:
+        rebalancer.close()
     
-    logging.info("Simulación finalizada")
\ No newline at end of file
+    log.info("Simulación finalizada")
\ No newline at end of file
@@ -1,10 +1,137 @@
-from prometheus_client import start_http_server, Gauge, REGISTRY
-from config import Config
+from prometheus_client import start_http_server, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from config import CONFIG
+from utils import call_with_backoff
 import logging
 import random
 import time
 import os
 import requests
+import ssl
+import urllib3
+from collections import deque
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from typing import Dict, NamedTuple, Optional
+
+# orjson (opcional) decodifica las respuestas de Prometheus bastante más rápido que json
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+# La sesión con Prometheus no verifica certificados (verify=False): evitar un warning por petición
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+class _InsecureTLSAdapter(HTTPAdapter):
+    """
+    HTTPAdapter con un único SSLContext sin verificación compartido por todas las conexiones.
+    Sin él, urllib3 crea (y carga los certificados de) un contexto nuevo en cada conexión TLS.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        self._ssl_context = ssl.create_default_context()
+        self._ssl_context.check_hostname = False
+        self._ssl_context.verify_mode = ssl.CERT_NONE
+        super().__init__(*args, **kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self._ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+
+# Capacidad máxima del historial (muestras dentro de la ventana de estabilización)
+_HISTORY_CAPACITY = 1024
+
+# Muestras simuladas casi idénticas a la anterior (menos de _SAMPLE_EPSILON puntos de CPU/memoria,
+# mismos pods) y separadas menos de _MIN_SAMPLE_INTERVAL segundos no se registran
+_MIN_SAMPLE_INTERVAL = 1.0
+_SAMPLE_EPSILON = 0.5
+
+
+# Métricas simuladas reconocidas en una query (campos de MetricSample), por orden de prioridad
+_SIMULATED_METRIC_KEYS = ('cpu', 'memory', 'response_time')
+
+
+@lru_cache(maxsize=64)
+def _simulated_metric_key(query: str) -> Optional[str]:
+    """Métrica simulada a la que corresponde una query (memoizado: las queries se repiten)"""
+    lowered = query.lower()
+    return next((key for key in _SIMULATED_METRIC_KEYS if key in lowered), None)
+
+
+# Factor de escalado 1 / max(1, pods^0.7) precalculado para los tamaños de despliegue habituales
+_POD_SCALE_LUT = tuple(1.0 / max(1, p ** 0.7) for p in range(16))
+
+
+# Etiqueta con la que get_prometheus_metrics_batch identifica cada expresión
+_BATCH_LABEL = 'batch_key'
+
+
+class MetricSample(NamedTuple):
+    """Muestra del historial de métricas"""
+    timestamp: float
+    cpu: float
+    memory: float
+    response_time: float
+
+
+class _RunningMean:
+    """Media incremental (Welford) que admite altas y bajas de muestras en O(1)"""
+    __slots__ = ('n', 'mean')
+    
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+    
+    def add(self, x: float):
+        self.n += 1
+        self.mean += (x - self.mean) / self.n
+    
+    def remove(self, x: float):
+        self.n -= 1
+        if self.n == 0:
+            self.mean = 0.0
+        else:
+            self.mean -= (x - self.mean) / self.n
+
+
+class _MetricsCollector:
+    """
+    Collector Prometheus que expone la última muestra de ScalingMetrics al hacer scrape.
+    Sustituye a los Gauge: update_metrics solo guarda la muestra, sin locks por métrica.
+    """
+    # Nombres expuestos por collect()
+    NAMES = ('service_cpu_usage', 'service_memory_usage', 'service_pod_count', 'service_response_time')
+    # Collector registrado en este proceso (se registra una sola vez)
+    _registered: Optional['_MetricsCollector'] = None
+    
+    def __init__(self, metrics: 'ScalingMetrics'):
+        self._metrics = metrics
+    
+    @classmethod
+    def bind(cls, metrics: 'ScalingMetrics'):
+        """Apunta el collector a la instancia más reciente, registrándolo solo la primera vez"""
+        if cls._registered is not None:
+            cls._registered._metrics = metrics
+            return
+        # Limpiar métricas existentes con esos nombres (p.ej. tras recargar el módulo)
+        collectors = REGISTRY._names_to_collectors
+        for name in cls.NAMES:
+            stale = collectors.get(name)
+            if stale is not None:
+                REGISTRY.unregister(stale)
+        cls._registered = cls(metrics)
+        REGISTRY.register(cls._registered)
+    
+    def collect(self):
+        sample = self._metrics._last_sample
+        yield GaugeMetricFamily('service_cpu_usage', 'Uso de CPU del servicio en porcentaje', value=sample.cpu)
+        yield GaugeMetricFamily('service_memory_usage', 'Uso de memoria del servicio en porcentaje', value=sample.memory)
+        yield GaugeMetricFamily('service_pod_count', 'Número de pods en ejecución', value=self._metrics._pod_count)
+        yield GaugeMetricFamily('service_response_time', 'Tiempo medio de respuesta en segundos', value=sample.response_time)
+
 
 class ScalingMetrics:
     """
@@ -15,76 +142,109 @@ class ScalingMetrics:
     """
     
     def __init__(self):
-        self.config = Config()
+        self.config = CONFIG
+        # Umbrales de escalado como floats de instancia (se consultan en cada should_scale_up)
+        self._min_change_period = float(self.config.MIN_CHANGE_PERIOD)
+        self._stabilization_window = float(self.config.STABILIZATION_WINDOW)
+        self._max_response_time = float(self.config.MAX_RESPONSE_TIME)
+        self._response_time_threshold = float(self.config.RESPONSE_TIME_THRESHOLD)
+        self._cpu_threshold = float(self.config.CPU_SCALING_THRESHOLD)
+        self._memory_threshold = float(self.config.MEMORY_SCALING_THRESHOLD)
         self.last_scale_time = 0
-        self.metric_history = []
+        # Buffer circular ordenado por timestamp: las muestras caducadas salen por la izquierda
+        self.metric_history = deque(maxlen=_HISTORY_CAPACITY)
+        # Medias de la ventana mantenidas al añadir/caducar muestras (sin recorrer el historial)
+        self._cpu_mean = _RunningMean()
+        self._memory_mean = _RunningMean()
+        self._response_mean = _RunningMean()
         
-        # Limpiar métricas existentes
-        for metric in ['service_cpu_usage', 'service_memory_usage', 'service_pod_count', 'service_response_time']:
-            if metric in REGISTRY._names_to_collectors:
-                REGISTRY.unregister(REGISTRY._names_to_collectors[metric])
+        # Métricas Prometheus: el collector lee la última muestra solo cuando hay scrape
+        self._last_sample = MetricSample(0.0, 0.0, 0.0, 0.0)
+        self._pod_count = 0
+        _MetricsCollector.bind(self)
         
-        # Métricas Prometheus
-        self.cpu_usage = Gauge('service_cpu_usage', 'Uso de CPU del servicio en porcentaje', registry=REGISTRY)
-        self.memory_usage = Gauge('service_memory_usage', 'Uso de memoria del servicio en porcentaje', registry=REGISTRY)
-        self.pod_count = Gauge('service_pod_count', 'Número de pods en ejecución', registry=REGISTRY)
-        self.response_time = Gauge('service_response_time', 'Tiempo medio de respuesta en segundos', registry=REGISTRY)
+        # Sesión HTTP persistente (keep-alive) para consultas a Prometheus
+        self._session = requests.Session()
+        self._session.headers['Accept-Encoding'] = 'gzip'
+        # Autenticación con bearer token (fijada una vez en la sesión)
+        if 'PROMETHEUS_TOKEN' in os.environ:
+            self._session.headers['Authorization'] = f'Bearer {os.environ["PROMETHEUS_TOKEN"]}'
+        self._session.verify = False  # Solo para desarrollo, en producción usar certificados
+        self._prom_url = f"{self.config.PROMETHEUS_URL}/api/v1/query"
+        self._prom_timeout = (self.config.PROMETHEUS_CONNECT_TIMEOUT, self.config.PROMETHEUS_READ_TIMEOUT)
+        adapter = _InsecureTLSAdapter(
+            pool_connections=4,
+            pool_maxsize=4,
+            max_retries=0  # Los reintentos los hace call_with_backoff (una sola capa de backoff)
+        )
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
         
         start_http_server(8000)
     
-    def update_metrics(self, cpu_usage: float, memory_usage: float, current_pods: int, response_time: float = None):
-        """Registra métricas incluyendo tiempo de respuesta"""
+    def update_metrics(self, cpu_usage: float, memory_usage: float, current_pods: int, response_time: float = None) -> float:
+        """Registra métricas incluyendo tiempo de respuesta y devuelve el tiempo de respuesta registrado"""
         now = time.time()
         
         # Si no se provee response_time, calcular uno basado en carga
         if response_time is None:
+            last = self._last_sample
+            if (now - last.timestamp < _MIN_SAMPLE_INTERVAL
+                    and current_pods == self._pod_count
+                    and abs(cpu_usage - last.cpu) < _SAMPLE_EPSILON
+                    and abs(memory_usage - last.memory) < _SAMPLE_EPSILON):
+                # Carga sin cambios: se reutiliza la muestra anterior
+                return last.response_time
             response_time = self._calculate_simulated_response_time(cpu_usage, memory_usage, current_pods)
             
-        self.metric_history.append({
-            'timestamp': now,
-            'cpu': cpu_usage,
-            'memory': memory_usage,
-            'response_time': response_time
-        })
+        if len(self.metric_history) == self.metric_history.maxlen:
+            self._drop_oldest_sample()
+        sample = MetricSample(now, cpu_usage, memory_usage, response_time)
+        self.metric_history.append(sample)
+        self._cpu_mean.add(cpu_usage)
+        self._memory_mean.add(memory_usage)
+        self._response_mean.add(response_time)
         
-        # Mantener solo métricas recientes
-        self.metric_history = [m for m in self.metric_history 
-                             if m['timestamp'] > now - self.config.STABILIZATION_WINDOW]
+        # Mantener solo métricas recientes (las más antiguas están siempre al principio)
+        cutoff = now - self._stabilization_window
+        while self.metric_history and self.metric_history[0].timestamp <= cutoff:
+            self._drop_oldest_sample()
         
-        self.cpu_usage.set(cpu_usage)
-        self.memory_usage.set(memory_usage)
-        self.pod_count.set(current_pods)
-        self.response_time.set(response_time)
+        self._last_sample = sample
+        self._pod_count = current_pods
+        return response_time
+    
+    def _drop_oldest_sample(self):
+        """Elimina la muestra más antigua del historial y de las medias"""
+        sample = self.metric_history.popleft()
+        self._cpu_mean.remove(sample.cpu)
+        self._memory_mean.remove(sample.memory)
+        self._response_mean.remove(sample.response_time)
     
     def _calculate_simulated_response_time(self, cpu: float, memory: float, pods: int) -> float:
         """Simula el tiempo de respuesta basado en carga y pods"""
-        base_time = 0.2  # Tiempo base en segundos
-        
-        # Impacto de la carga de CPU (cuadrático para simular degradación)
-        cpu_factor = (cpu / 100) ** 2 
-        
-        # Impacto de la carga de memoria (lineal)
-        mem_factor = (memory / 100)
-        
-        # Factor de escalado (mejora con más pods)
-        scaling_factor = 1.0 / max(1, pods ** 0.7)
+        # Factor de escalado (mejora con más pods); fuera de la tabla se calcula la potencia
+        if 0 <= pods < len(_POD_SCALE_LUT):
+            scaling_factor = _POD_SCALE_LUT[pods]
+        else:
+            scaling_factor = 1.0 / max(1, pods ** 0.7)
         
-        return base_time + (cpu_factor * mem_factor * scaling_factor * 3.0)
+        # Tiempo base 0.2s + CPU (cuadrático, degradación) * memoria (lineal) * 3.0,
+        # con las divisiones entre 100 plegadas en constantes
+        return 0.2 + cpu * cpu * memory * scaling_factor * 3e-6
     
     def _metrics_are_stable(self) -> bool:
         """Determina si las métricas son estables en la ventana de tiempo"""
         if len(self.metric_history) < 3:
             return False
             
-        avg_cpu = sum(m['cpu'] for m in self.metric_history) / len(self.metric_history)
-        avg_memory = sum(m['memory'] for m in self.metric_history) / len(self.metric_history)
-        
-        # Verificar que no haya fluctuaciones mayores al 15%
-        for m in self.metric_history:
-            if (abs(m['cpu'] - avg_cpu) > 15 or 
-                abs(m['memory'] - avg_memory) > 15):
-                return False
-        return True
+        # Verificar que no haya fluctuaciones mayores al 15% respecto a las medias de la ventana
+        avg_cpu = self._cpu_mean.mean
+        avg_memory = self._memory_mean.mean
+        return all(
+            abs(m.cpu - avg_cpu) <= 15 and abs(m.memory - avg_memory) <= 15
+            for m in self.metric_history
+        )
     
     def should_scale_up(self) -> bool:
         """
@@ -94,37 +254,34 @@ class ScalingMetrics:
         now = time.time()
         
         # Verificar cooldown
-        if now - self.last_scale_time < self.config.MIN_CHANGE_PERIOD:
+        if now - self.last_scale_time < self._min_change_period:
             logging.info("[COOLDOWN] En periodo de enfriamiento. No escalar")
             return False
             
         if not self.metric_history:
             return False
             
-        # Calcular promedios
-        avg_cpu = sum(m['cpu'] for m in self.metric_history) / len(self.metric_history)
-        avg_memory = sum(m['memory'] for m in self.metric_history) / len(self.metric_history)
-        avg_response = sum(m['response_time'] for m in self.metric_history) / len(self.metric_history)
+        # El tiempo de respuesta es el disparador más habitual: se evalúa primero
+        avg_response = self._response_mean.mean
         
-        logging.info(f"[CRITERIO] Tiempo Respuesta: {avg_response:.3f}s (Umbral: {self.config.RESPONSE_TIME_THRESHOLD}s)")
+        logging.info("[CRITERIO] Tiempo Respuesta: %.3fs (Umbral: %ss)",
+                     avg_response, self._response_time_threshold)
         
         # Prioridad 1: Tiempo de respuesta crítico
-        if avg_response > self.config.MAX_RESPONSE_TIME:
+        if avg_response > self._max_response_time:
             self.last_scale_time = now
             logging.info("[ESCALADO URGENTE] Tiempo de respuesta supera máximo permitido")
             return True
             
         # Prioridad 2: Tiempo de respuesta cercano al umbral
-        if avg_response > self.config.RESPONSE_TIME_THRESHOLD:
+        if avg_response > self._response_time_threshold:
             self.last_scale_time = now
             logging.info("[ESCALADO] Tiempo de respuesta supera umbral óptimo")
             return True
             
-        # Prioridad 3: Umbrales tradicionales de recursos
-        cpu_ok = avg_cpu > self.config.CPU_SCALING_THRESHOLD
-        mem_ok = avg_memory > self.config.MEMORY_SCALING_THRESHOLD
-        
-        if cpu_ok or mem_ok:
+        # Prioridad 3: Umbrales tradicionales de recursos (memoria solo si la CPU no basta)
+        if (self._cpu_mean.mean > self._cpu_threshold
+                or self._memory_mean.mean > self._memory_threshold):
             self.last_scale_time = now
             logging.info("[ESCALADO] Umbral de recursos superado")
             return True
@@ -145,38 +302,80 @@ class ScalingMetrics:
             return self._get_simulated_metric(query)
             
         try:
-            prometheus_url = f"{self.config.PROMETHEUS_URL}/api/v1/query"
-            params = {'query': query}
-            
-            # Autenticación con bearer token
-            headers = {}
-            if 'PROMETHEUS_TOKEN' in os.environ:
-                headers['Authorization'] = f'Bearer {os.getenv("PROMETHEUS_TOKEN")}'
-            
-            response = requests.get(
-                prometheus_url,
-                params=params,
-                headers=headers,
-                verify=False  # Solo para desarrollo, en producción usar certificados
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            if data['status'] == 'success' and data['data']['result']:
-                return float(data['data']['result'][0]['value'][1])
+            result = call_with_backoff(self._query_prometheus, query, retry_on=(requests.RequestException,))
+            if result:
+                return float(result[0]['value'][1])
             
             return 0.0
             
         except Exception as e:
-            logging.error(f"Error obteniendo métricas de Prometheus: {str(e)}")
+            logging.error("Error obteniendo métricas de Prometheus: %s", e)
             return 0.0
     
+    def get_prometheus_vector(self, query: str, label: str) -> Dict[str, float]:
+        """
+        Obtiene un vector instantáneo de Prometheus indexado por el valor de una etiqueta
+        Pensado para reglas de grabación que pre-agregan varias series, p.ej.:
+        - 'keda:ns:metrics{namespace="default"}' -> {'cpu': ..., 'mem': ..., 'pods': ...}
+        """
+        if os.getenv('ENVIRONMENT') == 'local':
+            # En local simulamos la regla de grabación keda:ns:metrics
+            return {
+                'cpu': self._last_sample.cpu,
+                'mem': self._last_sample.memory,
+                'pods': float(self._pod_count)
+            }
+            
+        try:
+            return {
+                series['metric'].get(label, ''): float(series['value'][1])
+                for series in call_with_backoff(self._query_prometheus, query, retry_on=(requests.RequestException,))
+            }
+        except Exception as e:
+            logging.error("Error obteniendo métricas de Prometheus: %s", e)
+            return {}
+    
+    def get_prometheus_metrics_batch(self, queries: Dict[str, str]) -> Dict[str, float]:
+        """
+        Evalúa varias queries escalares en una sola petición a Prometheus
+        Cada expresión se etiqueta con su nombre (label_replace) y se combinan con `or`:
+        - {'cpu': q1, 'mem': q2} -> label_replace(q1, "batch_key", "cpu", "", "") or label_replace(q2, ...)
+        Las queries sin resultado devuelven 0.0
+        """
+        if os.getenv('ENVIRONMENT') == 'local':
+            return {name: self._get_simulated_metric(query) for name, query in queries.items()}
+        
+        combined = ' or '.join(
+            f'label_replace({query}, "{_BATCH_LABEL}", "{name}", "", "")'
+            for name, query in queries.items()
+        )
+        values = dict.fromkeys(queries, 0.0)
+        seen = set()
+        try:
+            for series in call_with_backoff(self._query_prometheus, combined, retry_on=(requests.RequestException,)):
+                name = series['metric'].get(_BATCH_LABEL)
+                # Como get_prometheus_metrics, se toma la primera serie de cada query
+                if name in values and name not in seen:
+                    seen.add(name)
+                    values[name] = float(series['value'][1])
+        except Exception as e:
+            logging.error("Error obteniendo métricas de Prometheus: %s", e)
+        return values
+    
+    def _query_prometheus(self, query: str) -> list:
+        """Ejecuta una query instantánea en Prometheus y devuelve data.result"""
+        # Con timeout: un Prometheus que acepta la conexión y no responde no bloquea para siempre
+        response = self._session.get(self._prom_url, params={'query': query}, timeout=self._prom_timeout)
+        response.raise_for_status()
+        
+        data = _json.loads(response.content)
+        if data['status'] == 'success':
+            return data['data']['result']
+        return []
+    
     def _get_simulated_metric(self, query: str) -> float:
         """Simula métricas Prometheus para entorno local"""
-        if 'cpu' in query.lower():
-            return self.cpu_usage._value.get()
-        elif 'memory' in query.lower():
-            return self.memory_usage._value.get()
-        elif 'response_time' in query.lower():
-            return self.response_time._value.get()
-        return 0.0
+        key = _simulated_metric_key(query)
+        if key is None:
+            return 0.0
+        return getattr(self._last_sample, key)
@@ -54,17 +54,14 @@ class SimuladorEscalado:
                 mem = random.uniform(75, 95)
                 fase = "ALTA"
             
-            # Actualizar métricas (el response_time se calcula automáticamente)
-            self.aks_manager.scaling_metrics.update_metrics(cpu, mem, self.current_pods)
-            
-            # Obtener métricas actuales para logging
-            current_metrics = self.aks_manager.scaling_metrics.metric_history[-1]
+            # Actualizar métricas (el response_time se calcula automáticamente y se devuelve)
+            response_time = self.aks_manager.scaling_metrics.update_metrics(cpu, mem, self.current_pods)
             
             logger.info(f"\n=== Fase {fase} - Iteración {i+1} ===\n"
                        f"- CPU: {cpu:.1f}%\n"
                        f"- Memoria: {mem:.1f}%\n"
                        f"- Pods: {self.current_pods}\n"
-                       f"- Tiempo Respuesta: {current_metrics['response_time']:.3f}s")
+                       f"- Tiempo Respuesta: {response_time:.3f}s")
             
             # Tomar decisión de escalado
             if self.aks_manager.scaling_metrics.should_scale_up() and self.current_pods < 10:
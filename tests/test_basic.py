@@ -1,24 +1,31 @@
 import pytest
+from types import SimpleNamespace
 from unittest.mock import MagicMock
 from main import ClusterRebalancer
 
+def _node(name, cpu, mem):
+    """Nodo mínimo con la forma de V1Node (sin MagicMock por atributo)"""
+    resources = {'cpu': cpu, 'memory': mem}
+    return SimpleNamespace(
+        metadata=SimpleNamespace(name=name, labels={}),
+        status=SimpleNamespace(allocatable=resources, capacity=dict(resources), conditions=[])
+    )
+
 @pytest.fixture
 def mock_rebalancer():
     rebalancer = ClusterRebalancer()
+    # Lógica de producción contra una API simulada
+    rebalancer.simulation_mode = False
     rebalancer.api = MagicMock()
     rebalancer.apps_api = MagicMock()
+    rebalancer.custom_api = MagicMock()
+    rebalancer.custom_api.list_cluster_custom_object.return_value = {'items': []}
+    rebalancer.api.list_pod_for_all_namespaces.return_value = SimpleNamespace(items=[])
     return rebalancer
 
 def test_get_node_metrics(mock_rebalancer):
     # Configurar mock
-    mock_node = MagicMock()
-    mock_node.metadata.name = "test-node"
-    mock_node.status.allocatable = {"cpu": "2", "memory": "8Gi"}
-    mock_node.status.capacity = {"cpu": "2", "memory": "8Gi"}
-    mock_node.metadata.labels = {}
-    mock_node.status.conditions = []
-    
-    mock_rebalancer.api.list_node.return_value.items = [mock_node]
+    mock_rebalancer.api.list_node.return_value = SimpleNamespace(items=[_node("test-node", "2", "8Gi")])
     
     # Ejecutar prueba
     metrics = mock_rebalancer.get_node_metrics()
@@ -26,3 +33,103 @@ def test_get_node_metrics(mock_rebalancer):
     # Verificar resultados
     assert "test-node" in metrics
     assert metrics["test-node"]["allocatable"]["cpu"] == "2"
+
+def test_plan_placements_respects_capacity():
+    rebalancer = ClusterRebalancer()
+    pods = [
+        {'name': f'big-{i}', 'resources': {'requests': {'cpu': '1.5', 'memory': '1Gi'}}}
+        for i in range(4)
+    ]
+    
+    placements = rebalancer._plan_placements(
+        pods, [('aks-spot-1', 1.0), ('aks-spot-2', 1.0)], rebalancer.get_node_metrics()
+    )
+    
+    # 4 cores en aks-spot-1 y 2 en aks-spot-2: solo caben 3 pods de 1.5 cores
+    assert len(placements) == 3
+    assert sorted(node for _, node in placements) == ['aks-spot-1', 'aks-spot-1', 'aks-spot-2']
+
+def test_evict_pod_retries_pdb_rejections(monkeypatch):
+    from kubernetes.client.rest import ApiException
+    monkeypatch.setattr("main.time.sleep", lambda _: None)
+    rebalancer = ClusterRebalancer()
+    rebalancer.api = MagicMock()
+    rebalancer.api.create_namespaced_pod_eviction.side_effect = [ApiException(status=429), None]
+    
+    assert rebalancer._evict_pod({'name': 'app-1', 'namespace': 'default'})
+    assert rebalancer.api.create_namespaced_pod_eviction.call_count == 2
+
+def test_spot_interruption_reschedules_all_pods():
+    rebalancer = ClusterRebalancer()
+    rebalancer.rebalance_cluster()
+    
+    rebalancer.simulate_spot_node_interruption('aks-spot-1')
+    
+    nodes = rebalancer.simulated_nodes
+    assert 'aks-spot-1' not in nodes
+    assert sum(len(info['pods']) for info in nodes.values()) == 10
+    for info in nodes.values():
+        assert info['current_cpu_usage'] <= info['_cpu_alloc']
+
+def test_production_migrations_evict_only_placeable_pods(mock_rebalancer):
+    node_metrics = {'aks-spot-1': {'_cpu_alloc': 2.0, 'current_cpu_usage': 1.0,
+                                   '_mem_alloc_gb': 8.0, 'current_mem_usage_gb': 1.0}}
+    pods = [
+        {'name': name, 'namespace': 'default', 'resources': {'requests': {'cpu': cpu, 'memory': '1Gi'}}}
+        for name, cpu in (('fits', '500m'), ('too-big', '2'))
+    ]
+    
+    mock_rebalancer._execute_migrations(pods, [('aks-spot-1', 1.0)], node_metrics)
+    
+    evicted = [c.kwargs['name'] for c in mock_rebalancer.api.create_namespaced_pod_eviction.call_args_list]
+    assert evicted == ['fits']
+
+def test_find_pods_skips_unmanaged_and_static_pods(mock_rebalancer):
+    def pod(name, owner_kind=None):
+        owners = [SimpleNamespace(kind=owner_kind, controller=True)] if owner_kind else None
+        return SimpleNamespace(
+            metadata=SimpleNamespace(name=name, namespace='default', labels={}, owner_references=owners,
+                                     creation_timestamp=None),
+            spec=SimpleNamespace(node_name='regular-1', containers=[])
+        )
+    mock_rebalancer.api.list_node.return_value = SimpleNamespace(items=[_node('regular-1', '4', '16Gi')])
+    mock_rebalancer.api.list_pod_for_all_namespaces.return_value = SimpleNamespace(items=[
+        pod('app', 'ReplicaSet'), pod('bare'), pod('kube-proxy', 'DaemonSet'), pod('etcd', 'Node')
+    ])
+    
+    assert [p['name'] for p in mock_rebalancer.find_pods_for_rebalance()] == ['app']
+
+def test_rebalance_trigger_is_debounced(monkeypatch):
+    import main
+    slept = []
+    monkeypatch.setattr(main.time, "sleep", slept.append)
+    rebalancer = ClusterRebalancer()
+    rebalancer.last_rebalance_time = main.time.time()
+    rebalancer._dirty.set()
+    
+    assert rebalancer.wait_for_rebalance_trigger()
+    assert slept and 0 < slept[0] <= rebalancer.config.REBALANCE_MIN_INTERVAL_SECONDS
+    assert not rebalancer._dirty.is_set()
+
+@pytest.mark.parametrize("quantity,expected_gb", [
+    ("512k", 512e3 / 1024 ** 3),
+    ("1e9", 1e9 / 1024 ** 3),
+    ("1Pi", 1024.0 ** 2),
+    ("2E", 2e18 / 1024 ** 3),
+    ("1500m", 1.5 / 1024 ** 3),
+    ("16Gi", 16.0),
+])
+def test_parse_memory_gb_accepts_all_quantity_forms(quantity, expected_gb):
+    from main import _parse_memory_gb
+    assert _parse_memory_gb(quantity) == pytest.approx(expected_gb)
+
+def test_executors_are_created_lazily_and_closed(mock_rebalancer):
+    simulated = ClusterRebalancer()
+    assert simulated._eviction_pool is None and simulated._api_pool is None
+    
+    mock_rebalancer.api.list_node.return_value = SimpleNamespace(items=[_node("test-node", "2", "8Gi")])
+    mock_rebalancer.get_node_metrics()
+    assert mock_rebalancer._api_pool is not None
+    
+    mock_rebalancer.close()
+    assert mock_rebalancer._api_pool is None
@@ -0,0 +1,65 @@
+import pytest
+from hpa_scheduler import _window_at, _cpu_millicores
+
+@pytest.mark.parametrize("hour,minute,expected", [
+    (0, 0, "night"),
+    (5, 59, "night"),
+    (6, 0, "morning"),
+    (12, 30, "afternoon"),
+    (18, 0, "evening"),
+    (23, 59, "evening"),
+])
+def test_window_at(hour, minute, expected):
+    window_name, window = _window_at(hour, minute)
+    
+    assert window_name == expected
+    assert "min_replicas" in window
+
+@pytest.mark.parametrize("quantity,expected", [
+    ("250m", 250),
+    ("123456789n", 123.456789),
+    ("1", 1000),
+    ("0m", 0),
+])
+def test_cpu_millicores(quantity, expected):
+    assert _cpu_millicores(quantity) == pytest.approx(expected)
+
+def test_run_once_retries_failed_adjustment_after_interval(monkeypatch):
+    from unittest.mock import MagicMock
+    from kubernetes.client.rest import ApiException
+    import utils
+    from hpa_scheduler import HPAScheduler
+    monkeypatch.setenv("ENVIRONMENT", "production")
+    monkeypatch.setattr(utils.time, "sleep", lambda seconds: None)
+    custom = MagicMock()
+    custom.get_namespaced_custom_object.return_value = {'spec': {}}
+    custom.patch_namespaced_custom_object.side_effect = ApiException(status=503)
+    scheduler = HPAScheduler({'custom': custom})
+    
+    assert scheduler.run_once("default", "app-hpa", interval=60) <= 60
+    assert scheduler.current_window is None
+
+def test_supervisor_does_not_block_on_slow_hpa():
+    import threading
+    from hpa_scheduler import HPASupervisor
+    
+    class FakeScheduler:
+        def __init__(self, delay):
+            self._stop_event = threading.Event()
+            self.delay = delay
+            self.calls = []
+        
+        def run_once(self, namespace, hpa_name, interval):
+            self.calls.append(interval)
+            self._stop_event.wait(self.delay)
+            self._stop_event.set()  # Un solo ciclo
+            return 3600
+    
+    supervisor = HPASupervisor()
+    slow, fast = FakeScheduler(delay=5), FakeScheduler(delay=0)
+    supervisor.add(slow, "default", "slow-hpa", interval=30)
+    supervisor.add(fast, "default", "fast-hpa", interval=15)
+    
+    assert fast._stop_event.wait(timeout=2)
+    assert fast.calls == [15]
+    slow._stop_event.set()
@@ -0,0 +1,66 @@
+import random
+from types import SimpleNamespace
+import pytest
+import scaling_metrics
+from scaling_metrics import _RunningMean
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """ScalingMetrics sin levantar el servidor HTTP de métricas"""
+    monkeypatch.setattr(scaling_metrics, "start_http_server", lambda port: None)
+    return scaling_metrics.ScalingMetrics()
+
+
+def test_running_mean_matches_window_average():
+    values = [random.uniform(0, 100) for _ in range(200)]
+    running = _RunningMean()
+    for x in values:
+        running.add(x)
+    for x in values[:150]:
+        running.remove(x)
+    
+    assert running.n == 50
+    assert abs(running.mean - sum(values[150:]) / 50) < 1e-9
+
+
+def test_prometheus_batch_uses_single_query(metrics, monkeypatch):
+    monkeypatch.setenv("ENVIRONMENT", "production")
+    sent = []
+    
+    def fake_query(query):
+        sent.append(query)
+        return [
+            {'metric': {'batch_key': 'cpu'}, 'value': [0, '42.5']},
+            {'metric': {'batch_key': 'pods'}, 'value': [0, '3']},
+        ]
+    monkeypatch.setattr(metrics, "_query_prometheus", fake_query)
+    
+    values = metrics.get_prometheus_metrics_batch({'cpu': 'avg(cpu)', 'mem': 'avg(mem)', 'pods': 'count(pods)'})
+    
+    assert len(sent) == 1
+    assert ' or ' in sent[0]
+    assert values == {'cpu': 42.5, 'mem': 0.0, 'pods': 3.0}
+
+
+def test_update_metrics_skips_redundant_samples(metrics):
+    first = metrics.update_metrics(50.0, 60.0, 2)
+    assert metrics.update_metrics(50.2, 60.1, 2) == first
+    metrics.update_metrics(50.2, 60.1, 3)
+    
+    assert len(metrics.metric_history) == 2
+
+
+def test_update_metrics_expires_samples_outside_window(metrics, monkeypatch):
+    # Reloj falso solo para scaling_metrics (el módulo time global no se toca)
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(scaling_metrics, "time", SimpleNamespace(time=lambda: clock.now))
+    window = metrics._stabilization_window
+    
+    for now, cpu in ((1000.0, 10.0), (1010.0, 20.0), (1010.0 + window + 1, 80.0)):
+        clock.now = now
+        metrics.update_metrics(cpu, 50.0, 2)
+    
+    assert [sample.cpu for sample in metrics.metric_history] == [80.0]
+    assert metrics._cpu_mean.n == 1
+    assert abs(metrics._cpu_mean.mean - 80.0) < 1e-9
@@ -0,0 +1,30 @@
+import pytest
+from kubernetes.client.rest import ApiException
+import utils
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(utils.time, "sleep", lambda seconds: None)
+
+def test_call_with_backoff_retries_transient_errors():
+    calls = []
+    
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ApiException(status=503)
+        return "ok"
+    
+    assert utils.call_with_backoff(flaky) == "ok"
+    assert len(calls) == 3
+
+def test_call_with_backoff_raises_permanent_errors():
+    calls = []
+    
+    def not_found():
+        calls.append(1)
+        raise ApiException(status=404)
+    
+    with pytest.raises(ApiException):
+        utils.call_with_backoff(not_found)
+    assert len(calls) == 1
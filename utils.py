@@ -4,19 +4,59 @@ Módulo de utilidades para el Cluster Rebalancer.
 Contiene funciones auxiliares para:
 - Cálculo de scores de nodos
 - Evicción segura de pods
+- Reintentos con backoff exponencial
 - Operaciones comunes
 """
 
 import logging
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, Callable, Optional, Tuple
 from kubernetes.client import CoreV1Api
 from kubernetes.client.rest import ApiException
 import time
 import random
-from config import Config  # Importar Config para acceder a TEST_MODE
+from config import CONFIG  # Configuración compartida (TEST_MODE)
 
+# Códigos HTTP que indican un error transitorio (se reintenta)
+_TRANSIENT_STATUS = {429, 500, 502, 503, 504}
 
-def safe_evict_pod(pod_name: str, namespace: str, max_retries: int = 3) -> bool:
+
+def _is_transient(error: Exception) -> bool:
+    """Determina si un error de API/HTTP es transitorio"""
+    status = getattr(error, 'status', None)  # kubernetes ApiException
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)  # requests.HTTPError
+    return not status or status in _TRANSIENT_STATUS
+
+
+def call_with_backoff(func: Callable, *args, retry_on: Tuple[type, ...] = (ApiException,),
+                      max_retries: int = 4, initial_wait: float = 1.0, max_wait: float = 30.0, **kwargs):
+    """
+    Ejecuta una llamada reintentando errores transitorios con:
+    - Backoff exponencial (initial_wait, 2x, 4x... hasta max_wait)
+    - Jitter aleatorio para evitar thundering herd
+    
+    Args:
+        func: Función a ejecutar con *args/**kwargs
+        retry_on: Tipos de excepción que se consideran reintentables
+        max_retries: Intentos máximos antes de relanzar la excepción
+        
+    Returns:
+        El resultado de func
+    """
+    for attempt in range(max_retries):
+        try:
+            return func(*args, **kwargs)
+        except retry_on as e:
+            if attempt == max_retries - 1 or not _is_transient(e):
+                raise
+            wait_time = min(max_wait, initial_wait * (2 ** attempt)) + random.uniform(0, 1)
+            logging.warning("Error transitorio (%s), reintentando en %.1fs", e, wait_time)
+            time.sleep(wait_time)
+
+
+def safe_evict_pod(pod_name: str, namespace: str, max_retries: int = 3,
+                   api: Optional[CoreV1Api] = None) -> bool:
     """
     Evicta un pod de manera segura con:
     - Verificación de existencia del pod
@@ -28,15 +68,28 @@ def safe_evict_pod(pod_name: str, namespace: str, max_retries: int = 3) -> bool:
         pod_name: Nombre del pod a evictar
         namespace: Namespace del pod
         max_retries: Intentos máximos antes de fallar
+        api: CoreV1Api a reutilizar entre evicciones (creado tras cargar la configuración
+             de Kubernetes); si no se indica, se crea uno con la configuración vigente
         
     Returns:
         bool: True si la evicción fue exitosa
     """
-    if Config().TEST_MODE:
+    if CONFIG.TEST_MODE:
         logging.info(f"[SIMULACIÓN] Evictando pod {pod_name} (no se realizan cambios reales)")
         return True
     
-    api = CoreV1Api()
+    if api is None:
+        api = CoreV1Api()
+    
+    # Objeto de evicción con política v1 (no depende del intento, se construye una vez)
+    body = {
+        "apiVersion": "policy/v1",
+        "kind": "Eviction",
+        "metadata": {
+            "name": pod_name,
+            "namespace": namespace
+        }
+    }
     
     for attempt in range(max_retries):
         try:
@@ -48,17 +101,7 @@ def safe_evict_pod(pod_name: str, namespace: str, max_retries: int = 3) -> bool:
                 logging.warning(f"Pod {pod_name} es crítico, no se puede evictar")
                 return False
             
-            # 3. Crear objeto de evicción con política v1
-            body = {
-                "apiVersion": "policy/v1",
-                "kind": "Eviction",
-                "metadata": {
-                    "name": pod_name,
-                    "namespace": namespace
-                }
-            }
-            
-            # 4. Ejecutar la evicción
+            # 3. Ejecutar la evicción
             api.create_namespaced_pod_eviction(
                 name=pod_name,
                 namespace=namespace,
@@ -96,25 +139,30 @@ def calculate_node_score(node_info: Dict[str, Any]) -> float:
         float: Score entre 0.1 y 1.5 (mayor es mejor)
     """
     try:
-        is_spot = node_info.get('is_spot', False)
-        
-        # Convertir recursos asignables a valores numéricos
-        cpu_alloc = float(node_info['allocatable']['cpu'])
-        mem_alloc = float(node_info['allocatable']['memory'].rstrip('Gi'))
-        
-        # Score base + bonus por ser spot + penalización por utilización
-        score = 1.0  # Puntuación base para nodos regulares
-        
-        # Bonus del 50% para nodos Spot
-        if is_spot:
-            score += 0.5
-        
-        # Penalizar nodos muy utilizados (30% del score por utilización)
-        utilization = (cpu_alloc + mem_alloc) / 2
-        score -= utilization * 0.3
-        
-        # Asegurar un mínimo de 0.1 para nodos muy utilizados
-        return max(0.1, score)
+        allocatable = node_info['allocatable']
+        return _score_core(allocatable['cpu'], allocatable['memory'], bool(node_info.get('is_spot', False)))
     except Exception as e:
         logging.error(f"Error calculando score de nodo: {e}")
         return 0.0  # Score mínimo en caso de error
+
+
+@lru_cache(maxsize=1024)
+def _score_core(cpu: str, memory: str, is_spot: bool) -> float:
+    """Score de calculate_node_score memoizado por los valores asignables sin parsear"""
+    # Convertir recursos asignables a valores numéricos
+    cpu_alloc = float(cpu)
+    mem_alloc = float(memory.rstrip('Gi'))
+    
+    # Score base + bonus por ser spot + penalización por utilización
+    score = 1.0  # Puntuación base para nodos regulares
+    
+    # Bonus del 50% para nodos Spot
+    if is_spot:
+        score += 0.5
+    
+    # Penalizar nodos muy utilizados (30% del score por utilización)
+    utilization = (cpu_alloc + mem_alloc) / 2
+    score -= utilization * 0.3
+    
+    # Asegurar un mínimo de 0.1 para nodos muy utilizados
+    return max(0.1, score)